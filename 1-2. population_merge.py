@@ -1,27 +1,39 @@
 import pandas as pd
+from collections import defaultdict
+from openpyxl import load_workbook
+from excel_ingest import cell_value
 
 # 原始 Excel 檔案名稱
 input_file = './各鄉鎮在保人數分布/2016-2019 年各鄉鎮在保人數分布.xlsx'  # <- 替換為你的檔名
-output_csv = 'total_population_2016_2019.csv'
+output_csv = './各鄉鎮在保人數分布/total_population_2016_2019.csv'  # 5-2、8-3、9-7 等由此讀取
 
-# 讀取所有工作表
-all_sheets = pd.read_excel(input_file, sheet_name=None)
+# 以唯讀模式逐列讀取，一次只保留一張工作表的加總結果
+wb = load_workbook(input_file, read_only=True)
 
-# 存所有年度加總資料
-all_years_combined = []
+with open(output_csv, 'w', newline='', encoding='utf-8-sig') as f:
+    for i, sheet_name in enumerate(wb.sheetnames):
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = {name: j for j, name in enumerate(next(rows))}
+        id_col, name_col, year_col, pop_col = (header[c] for c in ['ID1_CITY', 'C_NAME', 'year', 'pop_c'])
 
-for sheet_name, df in all_sheets.items():
-    # 加總人口數 pop_c，依照行政區、名稱、年份
-    grouped = df.groupby(['ID1_CITY', 'C_NAME', 'year'], as_index=False)['pop_c'].sum()
-    grouped = grouped.rename(columns={'pop_c': 'total_pop'})
-    
-    all_years_combined.append(grouped)
+        # 加總人口數 pop_c，依照行政區、名稱、年份
+        totals = defaultdict(int)
+        for row in rows:
+            # 任一分組欄位空白就略過（與 groupby 預設丟棄缺值鍵相同），pop_c 缺值視為 0
+            if row[id_col] is None or row[name_col] is None or row[year_col] is None:
+                continue
+            key = (cell_value(row[id_col]), row[name_col], cell_value(row[year_col]))
+            totals[key] += cell_value(row[pop_col]) or 0
 
-# 合併所有年度資料
-final_df = pd.concat(all_years_combined, ignore_index=True)
-final_df['ID1_CITY'] = final_df['ID1_CITY'].astype(str).str.zfill(4)
+        grouped = pd.DataFrame(
+            [(*key, total_pop) for key, total_pop in sorted(totals.items())],
+            columns=['ID1_CITY', 'C_NAME', 'year', 'total_pop']
+        )
+        grouped['ID1_CITY'] = grouped['ID1_CITY'].astype(str).str.zfill(4)
 
-# 輸出成 CSV
-final_df.to_csv(output_csv, index=False, encoding='utf-8-sig')
+        # 每張工作表處理完就接著寫入 CSV
+        grouped.to_csv(f, index=False, header=(i == 0))
+
+wb.close()
 
 print(f'已成功匯出至：{output_csv}')
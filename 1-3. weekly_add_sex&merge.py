@@ -0,0 +1,16 @@
+import os
+from excel_ingest import stream_disease_totals
+from island_filter import is_outlying_island
+from table_io import write_table
+
+# 讀取 Excel 檔案
+excel_path = "./每週呼吸道疾病就醫人數/2016-2019 年每週呼吸道疾病就醫人數.xlsx"  # 修改為你的檔案名稱
+output_folder = "周-呼吸道疾病就醫人-移除外島"
+
+os.makedirs(output_folder, exist_ok=True)
+
+# 與月資料相同的加總方式（合併 sex），讀取時即移除外島，不需再經過 3. filter_island.py
+for disease, combined_df in stream_disease_totals(
+        excel_path, 'week', keep_city=lambda city_id: not is_outlying_island(city_id)):
+    output_path = write_table(combined_df, output_folder, disease + "_filtered")
+    print(f"✅ 輸出完成：{output_path}")
@@ -0,0 +1,172 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import town_dim
+from group_agg import group_matrix, region_grouping, to_grid, town_grid
+from island_filter import drop_outlying_islands
+from table_io import list_tables, read_table, table_stem
+from town_dim import CODE_MAP_PATH, load_town_dim, name_to_key
+
+# PM2.5 前處理：由同一份原始測值一次產生 鄉鎮×週、鄉鎮×月、五大地區×月 三種序列
+# 原始資料：PM25_raw/ 下的表格檔（例如每月一檔），欄位 town（測站所在鄉鎮）、date、PM2.5，測站或鄉鎮、逐時或逐日皆可
+# 同一鄉鎮同一天的測值先平均成日值；週、月數值為「期間內有測值日的平均 × 期間天數」
+# （與既有 PM25_*.csv 的加總尺度相同，缺測的日子不會把數值拉低）
+# 五大地區為本島各鄉鎮月值以在保人數加權平均（外島規則同 3.）
+raw_folder = "PM25_raw"
+pop_csv_path = "./各鄉鎮在保人數分布/total_population_2016_2019.csv"
+weekly_path = "PM25_weekly_by_town.csv"
+monthly_path = "PM25_monthly_by_town.csv"
+region_path = "PM25_monthly_by_region.csv"
+
+# 每個原始檔的 鄉鎮×日 部分加總快取在 pm25_cache/，檔名含原始檔與鄉鎮維度表的雜湊
+# 只有新增或變動的原始檔會重新讀取，其餘直接沿用快取；三個輸出檔每次都由全部部分加總重新計算、整檔改寫
+PM25_CACHE_DIR = "pm25_cache"
+
+
+def file_hash(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+# === 1. 單一原始檔 → 鄉鎮×日 的測值總和與筆數 ===
+def read_raw(path, dim):
+    df = read_table(path, columns=['town', 'date', 'PM2.5'])
+
+    # 無效值（#、x、空白等）視為缺值
+    df['PM2.5'] = pd.to_numeric(df['PM2.5'], errors='coerce')
+    df = df.dropna(subset=['PM2.5'])
+
+    df['town_key'] = name_to_key(df['town'], dim)
+    unmatched = df.loc[df['town_key'] < 0, 'town'].unique()
+    if len(unmatched) > 0:
+        print(f"⚠️ {os.path.basename(path)} 以下地名無法對應：{', '.join(unmatched)}")
+    df = df[df['town_key'] >= 0]
+
+    df['day'] = pd.to_datetime(df['date']).dt.normalize().to_numpy().astype('datetime64[D]').astype(np.int64)
+    daily = df.groupby(['town_key', 'day'])['PM2.5'].agg(['sum', 'count']).reset_index()
+    return {
+        'town_key': daily['town_key'].to_numpy(dtype=np.int32),
+        'day': daily['day'].to_numpy(),
+        'total': daily['sum'].to_numpy(),
+        'count': daily['count'].to_numpy(),
+    }
+
+
+# === 2. 讀取各原始檔的部分加總，沒有快取或來源變動時重建 ===
+def load_partial(filename, dim, dim_hash):
+    path = os.path.join(raw_folder, filename)
+    stem = table_stem(filename)
+    key = hashlib.md5(f"{file_hash(path)}|{dim_hash}".encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(PM25_CACHE_DIR, f"{stem}_{key}.npz")
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return {name: cached[name] for name in cached.files}
+
+    partial = read_raw(path, dim)
+    for old_cache in os.listdir(PM25_CACHE_DIR):
+        if old_cache.rsplit("_", 1)[0] == stem:
+            os.remove(os.path.join(PM25_CACHE_DIR, old_cache))
+    np.savez(cache_path, **partial)
+    print(f"✅ 已更新部分加總：{filename}")
+    return partial
+
+
+# === 3. 合併所有原始檔，得到 鄉鎮×日 平均值 ===
+def load_daily(dim):
+    os.makedirs(PM25_CACHE_DIR, exist_ok=True)
+    dim_hash = "|".join([file_hash(CODE_MAP_PATH), file_hash(town_dim.__file__)])
+
+    filenames = list_tables(raw_folder)
+    partials = [load_partial(filename, dim, dim_hash) for filename in filenames]
+
+    # 移除已刪除原始檔的快取
+    stems = {table_stem(filename) for filename in filenames}
+    for old_cache in os.listdir(PM25_CACHE_DIR):
+        if old_cache.rsplit("_", 1)[0] not in stems:
+            os.remove(os.path.join(PM25_CACHE_DIR, old_cache))
+
+    # 同一鄉鎮同一天的測值可能分散在不同原始檔，先加總再平均
+    daily = pd.DataFrame({
+        name: np.concatenate([partial[name] for partial in partials]) for name in ['town_key', 'day', 'total', 'count']
+    })
+    daily = daily.groupby(['town_key', 'day'], as_index=False)[['total', 'count']].sum()
+    daily['PM2.5'] = daily['total'] / daily['count']
+
+    return daily.join(calendar_columns(daily['day'].to_numpy()))
+
+
+# 日期（自 1970-01-01 起的天數）→ year、month、week
+# 週次與健保週資料相同：以週日為一週的開始，1 月 1 日所在的週為第 1 週，年底不足 7 天的週為第 53 週
+def calendar_columns(day):
+    dates = pd.to_datetime(np.asarray(day).astype('datetime64[D]'))
+    jan1 = pd.to_datetime(pd.DataFrame({'year': dates.year, 'month': 1, 'day': 1}))
+    jan1_weekday = (jan1.dt.dayofweek.to_numpy() + 1) % 7   # 週日為 0
+    return pd.DataFrame({
+        'year': dates.year,
+        'month': dates.month,
+        'week': (dates.dayofyear.to_numpy() - 1 + jan1_weekday) // 7 + 1,
+    })
+
+
+# 每個 (year, 週或月) 的日曆天數，年初、年底不足 7 天的週依實際天數
+def period_days(years, period_col):
+    days = pd.date_range(f"{min(years)}-01-01", f"{max(years)}-12-31").to_numpy().astype('datetime64[D]').astype(np.int64)
+    return calendar_columns(days).groupby(['year', period_col]).size().rename('days')
+
+
+# === 4. 日值 → 週、月（有測值日的平均 × 期間天數） ===
+def resample(daily, dim, period_col):
+    df = daily.groupby(['town_key', 'year', period_col], as_index=False)['PM2.5'].mean()
+    days = period_days(df['year'].unique(), period_col)
+    df['PM2.5'] = df['PM2.5'] * days.reindex(pd.MultiIndex.from_frame(df[['year', period_col]])).to_numpy()
+    df['town'] = dim['C_NAME'].to_numpy()[df['town_key']]
+    df['ID1_CITY'] = dim['ID1_CITY'].to_numpy()[df['town_key']]
+    return df.sort_values(['year', period_col, 'town']).reset_index(drop=True)
+
+
+# === 5. 鄉鎮月值 → 五大地區（在保人數加權平均） ===
+def region_monthly(monthly, dim):
+    pop_df = pd.read_csv(pop_csv_path, dtype={'ID1_CITY': str})
+    pop_lookup = pop_df.set_index(['ID1_CITY', 'year'])['total_pop']
+
+    # 外島不列入五大地區
+    grid = town_grid(drop_outlying_islands(dim)['ID1_CITY'], sorted(monthly['year'].unique()), 12)
+    keys, matrix = group_matrix(grid, region_grouping(grid.levels[0]))
+    pm25 = to_grid(grid, monthly, 'PM2.5', 'month')
+    pop = pop_lookup.reindex(grid.droplevel('period')).to_numpy(dtype=float)
+
+    has_pm = ~np.isnan(pm25) & ~np.isnan(pop)
+    sums = matrix @ np.column_stack([np.where(has_pm, pop * np.nan_to_num(pm25), 0.0), np.where(has_pm, pop, 0.0)])
+
+    result = keys.rename(columns={'group': 'region', 'period': 'month'})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['PM2.5'] = (sums[:, 0] / sums[:, 1]).round(2)
+    return result[sums[:, 1] > 0].sort_values(['year', 'month', 'region']).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(raw_folder):
+        print(f"⚠️ 找不到原始 PM2.5 資料夾 {raw_folder}，保留現有的 PM2.5 檔案")
+    else:
+        dim = load_town_dim()
+        daily = load_daily(dim)
+
+        weekly = resample(daily, dim, 'week')
+        weekly['PM2.5'] = weekly['PM2.5'].round(2)
+        weekly[['town', 'year', 'week', 'PM2.5']].to_csv(weekly_path, index=False, encoding='utf-8-sig')
+        print(f"✅ 已輸出：{weekly_path}")
+
+        monthly = resample(daily, dim, 'month')
+        region = region_monthly(monthly, dim)
+        monthly['PM2.5'] = monthly['PM2.5'].round(2)
+        monthly[['town', 'year', 'month', 'PM2.5']].to_csv(monthly_path, index=False, encoding='utf-8-sig')
+        print(f"✅ 已輸出：{monthly_path}")
+
+        region.to_csv(region_path, index=False, encoding='utf-8-sig')
+        print(f"✅ 已輸出：{region_path}")
@@ -1,35 +1,70 @@
+import numpy as np
 import pandas as pd
 import os
+from table_io import list_tables, read_table
 
-# 輸入篩選後資料夾
-# input_folder = "周-呼吸道疾病就醫人-移除外島"
-input_folder = "補值後CSV"
+# 輸入資料夾 → (少週數清單, 缺週區段) 輸出檔名
+# 補值前的缺週區段即 5. 的補值計畫；補值後的結果用來檢查補值是否完整
+OUTPUTS = {
+    "周-呼吸道疾病就醫人-移除外島": ("少週數的.csv", "缺週區段.csv"),
+    "補值後CSV": ("少週數的_補值後.csv", "缺週區段_補值後.csv"),
+}
 
-# 用來儲存所有資料
-all_data = []
+# 環境變數 MISSING_INPUT 指定輸入資料夾（預設為補值後CSV；pipeline.py 補值前、後各跑一次）
+input_folder = os.environ.get("MISSING_INPUT", "補值後CSV")
+count_output, runs_output = OUTPUTS[input_folder]
 
-# 讀取所有 CSV 檔案
-for filename in os.listdir(input_folder):
-    if filename.endswith(".csv"):
-        filepath = os.path.join(input_folder, filename)
-        df = pd.read_csv(filepath, dtype={'ID1_CITY': str})
-        df['source_file'] = filename  # 可追溯資料來源
-        all_data.append(df)
+# 用來儲存各檔案的缺週結果（只保留缺週的鄉鎮年份）
+all_counts = []
+all_runs = []
 
-# 合併成一個總表
-merged_df = pd.concat(all_data, ignore_index=True)
+# 一次只讀一個檔案
+for filename in list_tables(input_folder):
+    df = read_table(os.path.join(input_folder, filename), columns=['ID1_CITY', 'year', 'week'])
+    df['ID1_CITY'] = df['ID1_CITY'].astype(str)
+    df = df.drop_duplicates()
 
-# 計算每個 ID1_CITY + year 的週數出現次數
-week_counts = (
-    merged_df.groupby(['ID1_CITY', 'year', 'source_file'])
-    .agg(week_count=('week', 'nunique'))
-    .reset_index()
-)
+    # 每個 ID1_CITY + year 的週數位元圖（第 n 週對應第 n-1 位元）
+    df['bit'] = np.left_shift(np.uint64(1), df['week'].to_numpy(dtype=np.uint64) - np.uint64(1))
+    bitmaps = df.groupby(['ID1_CITY', 'year'], observed=True)['bit'].sum()
 
-# 篩選出週數少於 53 的項目
-missing_weeks = week_counts[week_counts['week_count'] < 53]
+    # 展開成 (鄉鎮年份 × 53 週) 的出現矩陣
+    present = np.unpackbits(
+        bitmaps.to_numpy(dtype=np.uint64).astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little'
+    )[:, :53].astype(bool)
+    week_count = present.sum(axis=1)
+
+    # 篩選出週數少於 53 的項目
+    short = week_count < 53
+    keys = bitmaps.index[short]
+    all_counts.append(pd.DataFrame({
+        'ID1_CITY': keys.get_level_values('ID1_CITY'),
+        'year': keys.get_level_values('year'),
+        'source_file': filename,
+        'week_count': week_count[short],
+    }))
+
+    # 連續缺週區段：缺週矩陣前後補 0 後取差分，+1 為區段開始、-1 為區段結束
+    edges = np.diff(np.pad(~present[short], ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    start_row, start_col = np.nonzero(edges == 1)
+    _, end_col = np.nonzero(edges == -1)
+    all_runs.append(pd.DataFrame({
+        'ID1_CITY': keys.get_level_values('ID1_CITY')[start_row],
+        'year': keys.get_level_values('year')[start_row],
+        'source_file': filename,
+        'start_week': start_col + 1,
+        'end_week': end_col,
+        'missing_weeks': end_col - start_col,
+    }))
+
+# 合併各檔案結果，依 ID1_CITY、year、檔案排序
+missing_weeks = pd.concat(all_counts, ignore_index=True).sort_values(
+    ['ID1_CITY', 'year', 'source_file'], kind='stable', ignore_index=True)
+missing_runs = pd.concat(all_runs, ignore_index=True).sort_values(
+    ['ID1_CITY', 'year', 'source_file'], kind='stable', ignore_index=True)
 
 # 輸出為 CSV
-missing_weeks.to_csv("少週數的_補值後.csv", index=False, encoding="utf-8-sig")
+missing_weeks.to_csv(count_output, index=False, encoding="utf-8-sig")
+missing_runs.to_csv(runs_output, index=False, encoding="utf-8-sig")
 
-print("✅ 已找出缺少週數的鄉鎮市區，輸出為：缺少週數的鄉鎮市區.csv")
+print(f"✅ 已找出缺少週數的鄉鎮市區，輸出為：{count_output}、{runs_output}")
@@ -0,0 +1,87 @@
+import pandas as pd
+import os
+from group_agg import CITY_TO_REGION, aggregate, group_matrix, region_grouping, to_grid, town_grid
+from table_io import list_tables, read_table, table_stem, write_table
+
+# 資料夾與路徑設定
+weekly_folder = "補值後CSV"
+raw_weekly_folder = "周-呼吸道疾病就醫人-移除外島"
+monthly_folder = "月-呼吸道疾病就醫人數-移除外島"
+town_weekly_folder = "補值後轉發病比"      # 鄉鎮 × 週
+town_weekly_raw_folder = "不補值轉發病比"   # 鄉鎮 × 週（不補值，8. 的輸入，檔名不含 _filtered）
+town_monthly_folder = "月就醫轉比例"        # 鄉鎮 × 月
+region_monthly_folder = "月就醫比例(五群)"  # 五大地區 × 月
+pop_csv_path = "./各鄉鎮在保人數分布/total_population_2016_2019.csv"
+
+# 建立輸出資料夾
+for folder in [town_weekly_folder, town_weekly_raw_folder, town_monthly_folder, region_monthly_folder]:
+    os.makedirs(folder, exist_ok=True)
+
+# 讀取人口總表一次，建立 (ID1_CITY, year) → 人口數 的索引查表
+pop_df = pd.read_csv(pop_csv_path, dtype={'ID1_CITY': str})
+pop_lookup = pop_df.set_index(['ID1_CITY', 'year'])['total_pop']
+
+
+# 讀取資料夾中所有疾病檔案（每個檔案只讀一次），合併成一個長表，source 為檔案編號
+def read_all(folder):
+    filenames = list_tables(folder)
+    frames = [read_table(os.path.join(folder, filename)) for filename in filenames]
+    df = pd.concat(frames, keys=range(len(filenames)), names=['source', None]).reset_index(level='source')
+    df = df.reset_index(drop=True)
+    df['ID1_CITY'] = df['ID1_CITY'].astype(str)
+    return filenames, df
+
+
+# 以查表取得人口數並計算每千人病例數（所有疾病一次計算）
+def add_rate(df):
+    keys = pd.MultiIndex.from_arrays([df['ID1_CITY'], df['year']])
+    df['pop_total'] = pop_lookup.reindex(keys).to_numpy()
+    df['case_per_capita(‰)'] = (df['case_c'] / df['pop_total'] * 1000).round(3)
+    return df
+
+
+# 依來源檔案拆開輸出，stem 決定輸出檔名主體
+def write_each(df, filenames, output_folder, columns, stem=table_stem):
+    for source, part in df.groupby('source', sort=True):
+        output_path = write_table(part[columns].reset_index(drop=True), output_folder, stem(filenames[source]))
+        print(f"✅ 已處理並輸出：{output_path}")
+
+
+# === 1. 鄉鎮 × 週（補值後） ===
+weekly_files, weekly = read_all(weekly_folder)
+weekly = add_rate(weekly)
+write_each(weekly, weekly_files, town_weekly_folder, ['ID1_CITY', 'year', 'week', 'case_c', 'case_per_capita(‰)'])
+
+# === 1-2. 鄉鎮 × 週（不補值） ===
+raw_weekly_files, raw_weekly = read_all(raw_weekly_folder)
+raw_weekly = add_rate(raw_weekly)
+write_each(raw_weekly, raw_weekly_files, town_weekly_raw_folder, ['ID1_CITY', 'year', 'week', 'case_c', 'case_per_capita(‰)'],
+           stem=lambda filename: table_stem(filename).removesuffix("_filtered"))
+
+# === 2. 鄉鎮 × 月（不補值） ===
+monthly_files, monthly = read_all(monthly_folder)
+monthly = add_rate(monthly)
+write_each(monthly, monthly_files, town_monthly_folder, ['ID1_CITY', 'year', 'month', 'case_c', 'case_per_capita(‰)'])
+
+# === 3. 五大地區 × 月：沿用同一份月資料，以分組矩陣加總各區病例數與人口 ===
+# 確保沒有合併錯誤（人口數對應不到的城市視同未對應地區）
+unmapped = monthly['ID1_CITY'].str[:2].map(CITY_TO_REGION).isna() | monthly['pop_total'].isna()
+for source in monthly.loc[unmapped, 'source'].unique():
+    print(f"⚠️ {monthly_files[source]} 中有未對應的城市代碼")
+
+# 鄉鎮 × 年 × 月 網格與五大地區分組矩陣，所有疾病共用
+grid = town_grid(pop_lookup.index.get_level_values('ID1_CITY').unique(), sorted(monthly['year'].unique()), 12)
+keys, matrix = group_matrix(grid, region_grouping(grid.levels[0]))
+grid_pop = pop_lookup.reindex(grid.droplevel('period')).to_numpy(dtype=float)
+
+grouped = []
+for source in range(len(monthly_files)):
+    disease = monthly[monthly['source'] == source]
+    result = aggregate(keys, matrix, to_grid(grid, disease, 'case_c', 'month'), grid_pop)
+    result['source'] = source
+    grouped.append(result)
+grouped = pd.concat(grouped, ignore_index=True).rename(columns={'group': 'region', 'period': 'month'})
+grouped[['case_c', 'pop_total']] = grouped[['case_c', 'pop_total']].astype('int64')
+
+write_each(grouped, monthly_files, region_monthly_folder,
+           ['region', 'year', 'month', 'case_c', 'pop_total', 'case_per_capita(‰)'])
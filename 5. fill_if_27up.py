@@ -1,61 +1,58 @@
 import pandas as pd
+import numpy as np
 import os
+from table_io import find_table, read_table, table_stem, write_table
 
 input_folder = "周-呼吸道疾病就醫人-移除外島"
-missing_info_path = "少週數的.csv"
+missing_runs_path = "缺週區段.csv"   # 4. 以補值前資料產生的缺週區段，即補值計畫
 output_folder = "補值後CSV"
 os.makedirs(output_folder, exist_ok=True)
 
-# 讀取少週數的條目
-missing_df = pd.read_csv(missing_info_path, dtype={'ID1_CITY': str})
-missing_df = missing_df[(missing_df['week_count'] >= 27) & (missing_df['week_count'] < 53)]
+# 讀取缺週區段，每個 鄉鎮年份 的週數 = 53 - 缺週數，週數 27 以上才補值
+runs = pd.read_csv(missing_runs_path, dtype={'ID1_CITY': str})
+runs['week_count'] = 53 - runs.groupby(['source_file', 'ID1_CITY', 'year'])['missing_weeks'].transform('sum')
+runs = runs[runs['week_count'] >= 27]
 
 # 依 source_file 群組
-for filename, group in missing_df.groupby("source_file"):
-    filepath = os.path.join(input_folder, filename)
-    df = pd.read_csv(filepath, dtype={'ID1_CITY': str})
-
-    # 對該檔案中所有需要補值的 ID1_CITY + year 做補值
-    for _, row in group.iterrows():
-        city = row['ID1_CITY']
-        year = row['year']
-
-        subset = df[(df['ID1_CITY'] == city) & (df['year'] == year)]
-
-        # 建立完整週數表
-        full_weeks = pd.DataFrame({'week': list(range(1, 54))})
-        full_weeks['ID1_CITY'] = city
-        full_weeks['year'] = year
-
-        # 合併現有資料
-        merged = pd.merge(full_weeks, subset, on=['ID1_CITY', 'year', 'week'], how='left')
-
-        # 補值
-        merged['case_c'] = (
-            merged['case_c']
-            .astype(float)
+for filename, group in runs.groupby("source_file"):
+    filepath = find_table(input_folder, table_stem(filename))
+    df = read_table(filepath)
+
+    # 需要補值的 ID1_CITY + year（依缺週區段的順序，補值後的資料依此順序接在最後）
+    targets = group[['ID1_CITY', 'year']].drop_duplicates().reset_index(drop=True)
+
+    # 依缺週區段展開出要插入的空週（case_c 為缺值）
+    lengths = group['missing_weeks'].to_numpy()
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    gaps = group.loc[group.index.repeat(lengths), ['ID1_CITY', 'year']].reset_index(drop=True)
+    gaps['week'] = np.repeat(group['start_week'].to_numpy(), lengths) + offsets
+
+    # 目標城市年份的現有資料加上空週，依 目標順序、週次 排列
+    keys = pd.MultiIndex.from_arrays([df['ID1_CITY'].astype(str), df['year']])
+    is_target = keys.isin(pd.MultiIndex.from_frame(targets))
+    merged = pd.concat([df[is_target], gaps], ignore_index=True)
+    target_idx = pd.MultiIndex.from_frame(targets).get_indexer(
+        pd.MultiIndex.from_arrays([merged['ID1_CITY'].astype(str), merged['year']]))
+    merged = merged.iloc[np.lexsort((merged['week'].to_numpy(), target_idx))].reset_index(drop=True)
+
+    # 各 ID1_CITY + year 分組補值
+    merged['case_c'] = (
+        merged.groupby(['ID1_CITY', 'year'], sort=False)['case_c']
+        .transform(lambda s: (
+            s.astype(float)
             .interpolate(method='linear', limit_direction='both')
-            .fillna(method='ffill')  # ← 如果中間內插不到，就往前補
-            .fillna(method='bfill')  # ← 如果一開始都缺，就往後補
-            .round()
-            .astype('Int64')
-        )
-
-        # 補上其他欄位（若存在）
-        other_cols = [col for col in df.columns if col not in ['ID1_CITY', 'year', 'week', 'case_c']]
-        for col in other_cols:
-            if col not in merged.columns:
-                merged[col] = None
-
-        # 移除原資料中該城市該年的舊資料
-        df = df[~((df['ID1_CITY'] == city) & (df['year'] == year))]
+            .ffill()  # ← 如果中間內插不到，就往前補
+            .bfill()  # ← 如果一開始都缺，就往後補
+        ))
+        .round()
+        .astype('Int64')
+    )
 
-        # 插入補值後資料
-        df = pd.concat([df, merged[df.columns]], ignore_index=True)
+    # 移除原資料中這些城市年份的舊資料，插入補值後資料
+    df = pd.concat([df[~is_target], merged[df.columns]], ignore_index=True)
 
-        print(f'{city} {year} 補值完成')
+    print(f'{filename} 共 {len(targets)} 個城市年份補值完成')
 
     # 輸出檔案
-    output_path = os.path.join(output_folder, filename)
-    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    output_path = write_table(df, output_folder, table_stem(filename))
     print(f"✅ 補值完成並輸出：{output_path}")
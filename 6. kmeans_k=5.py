@@ -1,32 +1,172 @@
 import pandas as pd
 import os
 from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
 import numpy as np
+from parallel_runner import run_per_file
+from table_io import list_tables, table_stem
+from week_tensor import load_tensor
 
 input_folder = "補值後CSV"
 output_folder = "分群結果"
 os.makedirs(output_folder, exist_ok=True)
 
-# 遍歷每個疾病檔案
-for filename in os.listdir(input_folder):
-    if not filename.endswith(".csv"):
-        continue
+# 預設只擬合 k = N_CLUSTERS；環境變數 K_SWEEP=1 時一次掃描多個群數（K_MIN ~ K_MAX），
+# 每個 k 的 inertia、silhouette 寫入分群摘要（cluster 6 與 k 無關，每年只寫一次）
+# 分群地區（地圖使用）只輸出 k = N_CLUSTERS 的結果
+N_CLUSTERS = int(os.environ.get("N_CLUSTERS", 5))
+K_SWEEP = os.environ.get("K_SWEEP", "0") == "1"
+K_MIN = int(os.environ.get("K_MIN", 2))
+K_MAX = int(os.environ.get("K_MAX", 8))
+k_values = sorted(set(range(K_MIN, K_MAX + 1)) | {N_CLUSTERS}) if K_SWEEP else [N_CLUSTERS]
+
+# 分群模式：full（預設，每年重新擬合）、incremental（沿用中心點庫，只擬合新增的年份）
+# 中心點庫存於 分群結果/{疾病}_中心點.npz，記錄每年 k = N_CLUSTERS 的中心點（依輸出的 cluster 編號排列）
+CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "full")
+
+
+def load_centroids(path):
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as store:
+        if store['centers'].shape[1] != N_CLUSTERS:
+            return {}
+        return {int(year): centers for year, centers in zip(store['years'], store['centers'])}
+
+
+def save_centroids(path, centroids):
+    years = sorted(centroids)
+    np.savez(path, years=np.array(years), centers=np.stack([centroids[year] for year in years]))
+
+
+# 依序擬合每個 k，回傳 {k: (labels, centers, inertia, silhouette)}
+# k = N_CLUSTERS 維持原本的 KMeans 設定（有 seed 時以前一年的中心點為起點），其餘以前一個 k 的中心點為起點（warm start）
+def sweep_k(X, seed=None):
+    results = {}
+    centers = None
+    for k in k_values:
+        if k > len(X):
+            break
+
+        if k == N_CLUSTERS and seed is not None:
+            kmeans = KMeans(n_clusters=k, init=seed, n_init=1)
+        elif k == N_CLUSTERS or centers is None or len(centers) >= k:
+            kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto')
+        else:
+            # 補上離現有中心最遠的點作為新中心
+            init = centers
+            while len(init) < k:
+                dist = ((X[:, None, :] - init[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+                init = np.vstack([init, X[dist.argmax()]])
+            kmeans = KMeans(n_clusters=k, init=init, n_init=1)
+
+        labels = kmeans.fit_predict(X)
+        centers = kmeans.cluster_centers_
+        silhouette = silhouette_score(X, labels) if K_SWEEP and 1 < len(np.unique(labels)) < len(X) else np.nan
+        results[k] = (labels, centers, kmeans.inertia_, silhouette)
+    return results
+
+
+# 依分群結果建立地區分群表與群組摘要，缺週地區為 cluster 6
+# remap 為 True 時群組依年平均重新編號（最高為 0）；沿用前一年中心點時編號已對應，不重新排序
+# 回傳 (地區分群表, 群組摘要, 原編號 → 輸出編號)
+def label_clusters(pivot, cluster_labels, partial_ids, partial_avg, year, remap=True):
+    # ➤ 地區分群結果
+    cluster_df = pd.DataFrame({
+        'city_id': pivot.index,
+        'cluster': cluster_labels,
+        'year': year
+    })
+
+    # ➤ 若有部分資料缺週，補上 cluster = 6
+    if len(partial_ids) > 0:
+        partial_df = pd.DataFrame({
+            'city_id': partial_ids,
+            'cluster': 6,
+            'year': year
+        })
+        cluster_df = pd.concat([cluster_df, partial_df], ignore_index=True)
+
+    # ➤ 群組摘要
+    summary = (
+        cluster_df
+        .groupby('cluster')['city_id']
+        .agg(['count', lambda x: ','.join(x)])
+        .rename(columns={'count': '地區數量', '<lambda_0>': '地區列表'})
+        .reset_index()
+    )
+
+    # ➤ 加上就醫人數年平均（僅 cluster ≠ 6 的平均來自 pivot）
+    avg = pd.DataFrame({'cluster': cluster_labels, 'avg': pivot.mean(axis=1).to_numpy()})
+    avg_summary = avg.groupby('cluster')['avg'].mean().reset_index(name='就醫人數年平均')
+
+    # ➤ cluster 6 的補法（partial_ids 各自有資料週數的平均）
+    if len(partial_ids) > 0:
+        avg_summary = pd.concat([
+            avg_summary,
+            pd.DataFrame({'cluster': [6], '就醫人數年平均': [partial_avg]})
+        ], ignore_index=True)
+
+    # ➤ 重新排序 cluster 根據年平均，最高為 0
+    if remap:
+        valid_clusters = avg_summary[avg_summary['cluster'] != 6]
+        sorted_clusters = valid_clusters.sort_values('就醫人數年平均', ascending=False).reset_index(drop=True)
+        cluster_remap = {old: new for new, old in enumerate(sorted_clusters['cluster'])}
+    else:
+        cluster_remap = {label: label for label in np.unique(cluster_labels)}
+
+    # ➤ 保留 cluster 6 不變
+    cluster_remap[6] = 6
+
+    # ➤ 套用到 cluster_df 與 avg_summary、summary
+    cluster_df['cluster'] = cluster_df['cluster'].map(cluster_remap)
+    avg_summary['cluster'] = avg_summary['cluster'].map(cluster_remap)
+    summary['cluster'] = summary['cluster'].map(cluster_remap)
+
+    merged_summary = pd.merge(summary, avg_summary, on='cluster')
+    merged_summary['year'] = year
+    merged_summary = merged_summary.sort_values(by='cluster').reset_index(drop=True)
+    return cluster_df, merged_summary, cluster_remap
+
 
-    df = pd.read_csv(os.path.join(input_folder, filename), dtype={'ID1_CITY': str})
+# 處理單一疾病檔案
+def process_file(filename):
+    # 週資料張量（疾病檔案 × 鄉鎮 × 年 × 週），只取這個檔案的切片
+    tensor = load_tensor(input_folder)
+    d = tensor.files.index(filename)
 
-    # 只保留必要欄位
-    df = df[['ID1_CITY', 'year', 'week', 'case_c']]
+    assign_path = os.path.join(output_folder, f"{table_stem(filename)}_分群地區.csv")
+    summary_path = os.path.join(output_folder, f"{table_stem(filename)}_分群摘要.csv")
+    store_path = os.path.join(output_folder, f"{table_stem(filename)}_中心點.npz")
 
     # 分群結果暫存器
     all_assignments = []
     all_summary = []
+    centroids = {}
+
+    # 增量模式：中心點庫中已有的年份沿用既有輸出，不再擬合
+    if CLUSTER_MODE == "incremental" and os.path.exists(assign_path) and os.path.exists(summary_path):
+        centroids = load_centroids(store_path)
+        previous_assign = pd.read_csv(assign_path, dtype={'city_id': str})
+        previous_summary = pd.read_csv(summary_path)
+        all_assignments.append(previous_assign[previous_assign['year'].isin(list(centroids))])
+        all_summary.append(previous_summary[previous_summary['year'].isin(list(centroids))])
+    fitted_years = []
+
+    # 遍歷每年
+    for y, year in enumerate(tensor.years.tolist()):
+        if year in centroids:
+            continue
 
-    # 以 groupby('year') 遍歷每年
-    for year, group in df.groupby('year'):
-        # 建立 53 維向量資料（先不轉進 pivot）
-        week_counts = group.groupby('ID1_CITY')['week'].nunique()
-        full_ids = week_counts[week_counts == 53].index
-        partial_ids = week_counts[week_counts < 53].index
+        # 每個地區該年有資料的週數（該年完全沒有資料的地區不列入）
+        week_counts = tensor.present[d, :, y].sum(axis=1)
+        full = week_counts == 53
+        partial = (week_counts > 0) & (week_counts < 53)
+        if not full.any() and not partial.any():
+            continue
+        full_ids = tensor.towns[full]
+        partial_ids = tensor.towns[partial]
+        partial_avg = np.nanmean(tensor.values[d, partial, y], axis=1).mean() if partial.any() else np.nan
 
         if len(full_ids) == 0:
             print(f"⚠️ {filename} 的 {year} 沒有任何地區滿 53 週，全部歸 cluster 6")
@@ -42,88 +182,68 @@ for filename in os.listdir(input_folder):
                 'cluster': [6],
                 '地區數量': [len(partial_ids)],
                 '地區列表': [','.join(partial_ids)],
-                '就醫人數年平均': [group[group['ID1_CITY'].isin(partial_ids)].groupby('ID1_CITY')['case_c'].mean().mean()],
+                '就醫人數年平均': [partial_avg],
                 'year': [year]
             })
             all_summary.append(summary)
             continue
 
-        # ➤ 執行分群前先建立 pivot 資料（只針對滿 53 週的地區）
-        pivot = group[group['ID1_CITY'].isin(full_ids)].pivot_table(
-            index='ID1_CITY', columns='week', values='case_c', fill_value=0
-        )
-
-        # ➤ 執行 KMeans
-        kmeans = KMeans(n_clusters=5, random_state=42, n_init='auto')
-        cluster_labels = kmeans.fit_predict(pivot)
-
-        # ➤ 地區分群結果
-        cluster_df = pd.DataFrame({
-            'city_id': pivot.index,
-            'cluster': cluster_labels,
-            'year': year
-        })
-
-        # ➤ 若有部分資料缺週，補上 cluster = 6
         if len(partial_ids) > 0:
             print(f"⚠️ {filename} 中以下 city_id 在 {year} 年週數不足 53 週，歸為 cluster 6：{', '.join(partial_ids)}")
-            partial_df = pd.DataFrame({
-                'city_id': partial_ids,
-                'cluster': 6,
-                'year': year
-            })
-            cluster_df = pd.concat([cluster_df, partial_df], ignore_index=True)
 
-        all_assignments.append(cluster_df)
-
-        # ➤ 群組摘要
-        summary = (
-            cluster_df
-            .groupby('cluster')['city_id']
-            .agg(['count', lambda x: ','.join(x)])
-            .rename(columns={'count': '地區數量', '<lambda_0>': '地區列表'})
-            .reset_index()
+        # ➤ 執行分群前先取出 53 維向量（只針對滿 53 週的地區）
+        pivot = pd.DataFrame(
+            tensor.values[d, full, y], index=pd.Index(full_ids, name='ID1_CITY'), columns=range(1, 54)
         )
 
-        # ➤ 加上就醫人數年平均（僅 cluster ≠ 6 的平均來自 pivot）
-        pivot['cluster'] = cluster_labels
-        pivot['avg'] = pivot.drop(columns='cluster').mean(axis=1)
-        avg_summary = pivot.groupby('cluster')['avg'].mean().reset_index(name='就醫人數年平均')
-
-        # ➤ cluster 6 的補法（取 group 裡 partial_ids 的平均）
-        if len(partial_ids) > 0:
-            c6_avg = group[group['ID1_CITY'].isin(partial_ids)].groupby('ID1_CITY')['case_c'].mean().mean()
-            avg_summary = pd.concat([
-                avg_summary,
-                pd.DataFrame({'cluster': [6], '就醫人數年平均': [c6_avg]})
-            ], ignore_index=True)
-
-        # ➤ 重新排序 cluster（0~4）根據年平均，最高為 0，最低為 4
-        valid_clusters = avg_summary[avg_summary['cluster'] != 6]
-        sorted_clusters = valid_clusters.sort_values('就醫人數年平均', ascending=False).reset_index(drop=True)
-        cluster_remap = {old: new for new, old in enumerate(sorted_clusters['cluster'])}
-
-        # ➤ 保留 cluster 6 不變
-        cluster_remap[6] = 6
+        # ➤ 增量模式以前一年的中心點為起點，cluster 編號跨年對應
+        previous_years = [y for y in centroids if y < year]
+        seed = centroids[max(previous_years)] if CLUSTER_MODE == "incremental" and previous_years else None
+
+        # ➤ 執行各 k 的 KMeans
+        for k, (cluster_labels, centers, inertia, silhouette) in sweep_k(pivot.to_numpy(dtype=float), seed).items():
+            seeded = k == N_CLUSTERS and seed is not None
+            cluster_df, merged_summary, cluster_remap = label_clusters(
+                pivot, cluster_labels, partial_ids, partial_avg, year, remap=not seeded
+            )
+            if K_SWEEP:
+                # cluster 6 只在 k = N_CLUSTERS 保留一列（k、inertia、silhouette 留空）
+                is_partial = merged_summary['cluster'] == 6
+                if k != N_CLUSTERS:
+                    merged_summary = merged_summary[~is_partial].copy()
+                    is_partial = is_partial[~is_partial]
+                merged_summary['k'] = pd.Series(k, index=merged_summary.index, dtype='Int64').mask(is_partial)
+                merged_summary['inertia'] = np.where(is_partial, np.nan, inertia)
+                merged_summary['silhouette'] = np.where(is_partial, np.nan, silhouette)
+            all_summary.append(merged_summary)
+
+            if k == N_CLUSTERS:
+                all_assignments.append(cluster_df)
+
+                # ➤ 中心點依輸出的 cluster 編號排列後存入中心點庫
+                ordered = np.empty_like(centers)
+                for old, new in cluster_remap.items():
+                    if old != 6:
+                        ordered[new] = centers[old]
+                centroids[year] = ordered
+        fitted_years.append(year)
+
+    # 匯出檔案 1（每筆分群，k = N_CLUSTERS）
+    full_assign_df = pd.concat(all_assignments, ignore_index=True).sort_values('year', kind='stable')
+    full_assign_df.to_csv(assign_path, index=False, encoding='utf-8-sig')
 
-        # ➤ 套用到 cluster_df 與 avg_summary、summary
-        cluster_df['cluster'] = cluster_df['cluster'].map(cluster_remap)
-        avg_summary['cluster'] = avg_summary['cluster'].map(cluster_remap)
-        summary['cluster'] = summary['cluster'].map(cluster_remap)
+    # 匯出檔案 2（群組摘要，各 k 的 inertia 與 silhouette）
+    full_summary_df = pd.concat(all_summary, ignore_index=True).sort_values('year', kind='stable')
+    full_summary_df.to_csv(summary_path, index=False, encoding='utf-8-sig')
 
-        merged_summary = pd.merge(summary, avg_summary, on='cluster')
-        merged_summary['year'] = year
-        merged_summary = merged_summary.sort_values(by='cluster').reset_index(drop=True)
-        all_summary.append(merged_summary)
+    # 匯出檔案 3（中心點庫）
+    if centroids:
+        save_centroids(store_path, centroids)
 
-    # 匯出檔案 1（每筆分群）
-    full_assign_df = pd.concat(all_assignments, ignore_index=True)
-    assign_path = os.path.join(output_folder, f"{filename.replace('.csv', '')}_分群地區.csv")
-    full_assign_df.to_csv(assign_path, index=False, encoding='utf-8-sig')
+    return f"✅ 已完成分群：{filename}（擬合年份：{', '.join(map(str, fitted_years)) or '無'}）"
 
-    # 匯出檔案 2（群組摘要）
-    full_summary_df = pd.concat(all_summary, ignore_index=True)
-    summary_path = os.path.join(output_folder, f"{filename.replace('.csv', '')}_分群摘要.csv")
-    full_summary_df.to_csv(summary_path, index=False, encoding='utf-8-sig')
 
-    print(f"✅ 已完成分群：{filename}")
+if __name__ == "__main__":
+    # 先在主行程建立張量快取，子行程只需讀取
+    load_tensor(input_folder)
+    run_per_file(process_file, input_folder, filenames=list_tables(input_folder))
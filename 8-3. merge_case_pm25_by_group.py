@@ -0,0 +1,67 @@
+import pandas as pd
+import os
+from group_agg import aggregate, cluster_grouping, county_grouping, group_matrix, region_grouping, to_grid, town_grid
+from parallel_runner import run_per_file
+from table_io import list_tables, load_table, table_stem, write_table
+from town_dim import load_town_dim, name_to_key
+
+# 以任意分組聚合鄉鎮月資料：病例數、人口數直接加總，PM2.5 以人口加權平均
+# 分組：region（五大地區）、county（縣市）、cluster（分群結果中各疾病每年的 KMeans 分群）
+groupings = ["region", "county", "cluster"]
+
+case_folder = "月-呼吸道疾病就醫人數-移除外島"
+cluster_folder = "分群結果"
+output_root = "就診千分比對pm2.5(分組)"
+pop_csv_path = "./各鄉鎮在保人數分布/total_population_2016_2019.csv"
+pm25_path = "PM25_monthly_by_town.csv"
+
+for grouping in groupings:
+    os.makedirs(os.path.join(output_root, grouping), exist_ok=True)
+
+# 人口與地名對照
+pop_df = pd.read_csv(pop_csv_path, dtype={'ID1_CITY': str})
+dim = load_town_dim()
+
+# 鄉鎮 × 年 × 月 網格，人口與 PM2.5 先排到網格上，所有疾病共用
+grid = town_grid(sorted(pop_df['ID1_CITY'].unique()), sorted(pop_df['year'].unique()), 12)
+grid_pop = pop_df.set_index(['ID1_CITY', 'year'])['total_pop'].reindex(grid.droplevel('period')).to_numpy(dtype=float)
+
+# PM2.5 地名轉成 town_key，同一代碼有多個測值時取平均，再取回 ID1_CITY
+pm25_df = pd.read_csv(pm25_path)
+pm25_df['town_key'] = name_to_key(pm25_df['town'], dim)
+pm25_df = pm25_df[pm25_df['town_key'] >= 0].groupby(['town_key', 'year', 'month'], as_index=False)['PM2.5'].mean()
+pm25_df['ID1_CITY'] = dim['ID1_CITY'].to_numpy()[pm25_df['town_key']]
+grid_pm25 = to_grid(grid, pm25_df, 'PM2.5', 'month')
+
+# 固定的分組矩陣只建一次
+static_matrices = {
+    "region": group_matrix(grid, region_grouping(grid.levels[0])),
+    "county": group_matrix(grid, county_grouping(dim)),
+}
+
+
+# 處理單一疾病檔案
+def process_file(filename):
+    case_df = load_table(os.path.join(case_folder, filename), columns=['ID1_CITY', 'year', 'month', 'case_c'])
+    case = to_grid(grid, case_df, 'case_c', 'month')
+
+    outputs = []
+    for grouping in groupings:
+        if grouping == "cluster":
+            cluster_path = os.path.join(cluster_folder, f"{table_stem(filename)}_分群地區.csv")
+            if not os.path.exists(cluster_path):
+                print(f"⚠️ 找不到 {cluster_path}，略過 cluster 分組")
+                continue
+            keys, matrix = group_matrix(grid, cluster_grouping(cluster_path))
+        else:
+            keys, matrix = static_matrices[grouping]
+
+        result = aggregate(keys, matrix, case, grid_pop, grid_pm25).rename(columns={'period': 'month'})
+        result[['case_c', 'pop_total']] = result[['case_c', 'pop_total']].astype('int64')
+        outputs.append(write_table(result, os.path.join(output_root, grouping), f"{table_stem(filename)}_with_PM25"))
+
+    return f"✅ 已輸出：{', '.join(outputs)}"
+
+
+if __name__ == "__main__":
+    run_per_file(process_file, case_folder, filenames=list_tables(case_folder))
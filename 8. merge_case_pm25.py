@@ -1,40 +1,53 @@
 import pandas as pd
 import os
+from parallel_runner import run_per_file
+from table_io import list_tables, load_table, table_stem, write_table
+from town_dim import id_to_key, load_town_dim, name_to_key
 
 input_folder = "不補值轉發病比"
 output_folder = "就診千分比對pm2.5(不補值)"
 os.makedirs(output_folder, exist_ok=True)
 
-df_pm25 = pd.read_csv('PM25_weekly_by_town.csv')
-df_code = pd.read_csv('ID_CNAME.csv', dtype={'ID1_CITY': str})
+df_pm25 = load_table('PM25_weekly_by_town.csv')
+dim = load_town_dim()
 
-# 去除空白（避免匹配錯誤）
-df_code['C_NAME'] = df_code['C_NAME'].str.strip()
+# PM2.5 地名轉成 town_key；同一代碼有多個測值（例如嘉義市東區、西區）時取平均
+df_pm25['town_key'] = name_to_key(df_pm25['town'], dim)
+unmatched = df_pm25.loc[df_pm25['town_key'] < 0, 'town'].unique()
+if len(unmatched) > 0:
+    print(f"⚠️ PM2.5 以下地名無法對應：{', '.join(unmatched)}")
+df_pm25 = (
+    df_pm25[df_pm25['town_key'] >= 0]
+    .groupby(['town_key', 'year', 'week'], as_index=False)['PM2.5'].mean()
+)
 
-for filename in os.listdir(input_folder):
-    if not filename.endswith(".csv"):
-        continue
 
+def process_file(filename):
     # 讀取資料
-    df_case = pd.read_csv(os.path.join(input_folder, filename), dtype={'ID1_CITY': str})
+    df_case = load_table(os.path.join(input_folder, filename),
+                         columns=['ID1_CITY', 'year', 'week', 'case_per_capita(‰)'])
 
-    # 1️⃣ 將 ID1_CITY 對應到中文地區名稱
-    df_case = df_case.merge(df_code, on='ID1_CITY', how='left')
+    # 1️⃣ 將 ID1_CITY 對應到整數 town_key
+    df_case['town_key'] = id_to_key(df_case['ID1_CITY'], dim)
 
     # 檢查有沒有轉換不到的
-    missing = df_case[df_case['C_NAME'].isna()]
+    missing = df_case[df_case['town_key'] < 0]
     if not missing.empty:
-        print("⚠️ 以下地區代碼無法對應：")
+        print(f"⚠️ {filename} 以下地區代碼無法對應：")
         print(missing[['ID1_CITY']].drop_duplicates())
 
-    # 2️⃣ 將 C_NAME 改成 'town'，以利與 PM2.5 合併
-    df_case.rename(columns={'C_NAME': 'town'}, inplace=True)
+    # 2️⃣ 以 town_key 合併疾病與 PM2.5 資料
+    df_merged = pd.merge(df_case, df_pm25, on=['town_key', 'year', 'week'], how='inner')
 
-    # 3️⃣ 合併疾病與 PM2.5 資料
-    df_merged = pd.merge(df_case, df_pm25, on=['town', 'year', 'week'], how='inner')
+    # 3️⃣ 由維度表取回地名
+    df_merged['town'] = dim['C_NAME'].to_numpy()[df_merged['town_key']]
 
     # 4️⃣ 選取指定欄位並輸出
     df_final = df_merged[['town', 'year', 'week', 'case_per_capita(‰)', 'PM2.5']]
-    df_final.to_csv(os.path.join(output_folder, filename), index=False, encoding='utf-8-sig')
+    output_path = write_table(df_final, output_folder, table_stem(filename))
 
-    print(f"✅ 合併完成，已輸出為 {filename}")
+    return f"✅ 合併完成，已輸出為 {output_path}"
+
+
+if __name__ == "__main__":
+    run_per_file(process_file, input_folder, filenames=list_tables(input_folder))
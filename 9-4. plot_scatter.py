@@ -1,9 +1,13 @@
+import hashlib
+import json
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
 from matplotlib.lines import Line2D
 import numpy as np
+from lag_engine import file_hash, load_series, cached_align
+from parallel_runner import run_per_file
+from table_io import find_table
 
 # 設定中文字體
 plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'SimHei', 'Microsoft YaHei', 'STHeiti']
@@ -24,110 +28,160 @@ case_pm25_folder = "就診千分比對pm2.5(五群)"
 output_plot_folder = "scatter_plots_region_shift"
 os.makedirs(output_plot_folder, exist_ok=True)
 
-# 處理每個疾病的相關性 CSV
-for filename in os.listdir(correlation_folder):
-    if not filename.endswith(".csv"):
-        continue
+# 每張圖的輸入雜湊（各疾病一個 JSON），雜湊未變且圖檔存在就不重畫
+PLOT_CACHE_DIR = os.path.join("plot_cache", "scatter_region_shift")
+
+# 每個疾病畫前幾名的平移量、輸出解析度（可用環境變數 SCATTER_DPI 調整）
+TOP_K = 5
+SCATTER_DPI = int(os.environ.get("SCATTER_DPI", 300))
+
+
+# 所有平移量、所有區域的回歸線一次算完：以 (名次, 區域) 分組，bincount 求平均後再算離均差乘積和（封閉解 OLS）
+# 回傳 DataFrame：rank_idx, region, n, slope, intercept, x_min, x_max
+def region_fits(rank_idx, units, x, y, n_ranks):
+    regions = np.array(list(region_color_map))
+    region_idx = pd.Categorical(units, categories=regions).codes
+    keep = region_idx >= 0
+    group = rank_idx[keep] * len(regions) + region_idx[keep]
+    x, y = x[keep], y[keep]
+    n_groups = n_ranks * len(regions)
+
+    n = np.bincount(group, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.bincount(group, weights=x, minlength=n_groups) / n
+        y_mean = np.bincount(group, weights=y, minlength=n_groups) / n
+        xc = x - x_mean[group]
+        sxx = np.bincount(group, weights=xc * xc, minlength=n_groups)
+        sxy = np.bincount(group, weights=xc * (y - y_mean[group]), minlength=n_groups)
+        slope = sxy / sxx
+
+    x_min = np.full(n_groups, np.inf)
+    x_max = np.full(n_groups, -np.inf)
+    np.minimum.at(x_min, group, x)
+    np.maximum.at(x_max, group, x)
+
+    return pd.DataFrame({
+        "rank_idx": np.repeat(np.arange(n_ranks), len(regions)),
+        "region": np.tile(regions, n_ranks),
+        "n": n,
+        "slope": slope,
+        "intercept": y_mean - slope * x_mean,
+        "x_min": x_min,
+        "x_max": x_max,
+    })
+
+
+def draw_plot(disease_name, lag, pearson, spearman, pairs, fits, out_path):
+    colors = pd.Series(pairs.units).map(region_color_map)
+
+    # 繪製散布圖
+    plt.figure(figsize=(7, 6))
+    plt.scatter(pairs.x, pairs.y, alpha=0.6, c=colors)
+    plt.xlabel("PM2.5(μg/m³)")
+    plt.ylabel("就診人數(‰)")
+    plt.title(f"{disease_name}：lag={lag} 散布圖")
+
+    # 左上角文字顯示 Spearman 與 Pearson
+    stats_text = (
+        f"          總體\n"
+        f"Pearson: {pearson:.3f}\n"
+        f"Spearman: {spearman:.3f}"
+    )
+    plt.text(
+        0.02, 0.98,
+        stats_text,
+        transform=plt.gca().transAxes,
+        verticalalignment='top',
+        horizontalalignment='left',
+        fontsize=10,
+        bbox=dict(boxstyle="round", facecolor="white", alpha=0.7)
+    )
+
+    # 每個群集畫自己的線性回歸線，斜率直接加到圖例標籤中
+    legend_elements = []
+    for fit in fits.itertuples():
+        if fit.n < 2:
+            continue
+        color = region_color_map[fit.region]
+        x_range = np.linspace(fit.x_min, fit.x_max, 100)
+        plt.plot(x_range, fit.intercept + fit.slope * x_range, color=color, linewidth=1.8)
+        legend_elements.append(
+            Line2D([0], [0], marker='o', color='w', label=f"{fit.region} (m={fit.slope:.4f})",
+                   markerfacecolor=color, markersize=8)
+        )
 
-    disease_name = filename.replace("_filtered_with_PM25_lag.csv", "")
-    correlation_path = os.path.join(correlation_folder, filename)
-    correlation_df = pd.read_csv(correlation_path)
+    # 圖例顯示在右下角，含斜率
+    plt.legend(handles=legend_elements, title="區域", loc='lower right', frameon=True)
+
+    plt.tight_layout()
+    plt.savefig(out_path, dpi=SCATTER_DPI)
+    plt.close()
 
-    # 挑出 top5 Spearman lag
-    top5_lags = correlation_df.head(5)
+
+# 單一疾病：前幾名平移量的配對與各區域斜率一次算完，只重畫輸入有變動的圖
+def process_file(filename):
+    disease_name = filename.replace("_filtered_with_PM25_lag.csv", "")
+    correlation_df = pd.read_csv(os.path.join(correlation_folder, filename))
 
     # 讀入原始的就診 + PM2.5 資料
-    case_pm25_path = os.path.join(case_pm25_folder, f"{disease_name}_filtered_with_PM25.csv")
-    if not os.path.exists(case_pm25_path):
-        print(f"⚠️ 缺少檔案：{case_pm25_path}")
-        continue
-
-    df = pd.read_csv(case_pm25_path)
-    df = df[df['year'].between(2016, 2019)].copy()
-    df = df[["region", "year", "month", "case_per_capita(‰)", "PM2.5"]].dropna()
-    df["key"] = df["region"] + "_" + df["year"].astype(str) + "_" + df["month"].astype(str)
-
-    for rank, (_, row) in enumerate(top5_lags.iterrows(), start=1):
-        lag = int(row["平移量(月數)"])
-        pearson = row["Pearson 係數"]
-        spearman = row["Spearman 係數"]
-
-        df_shifted = df.copy()
-        df_shifted["new_month"] = df_shifted["month"] + lag
-        df_shifted["new_year"] = df_shifted["year"] + (df_shifted["new_month"] - 1) // 12
-        df_shifted["new_month"] = (df_shifted["new_month"] - 1) % 12 + 1
-        df_shifted["new_key"] = df_shifted["region"] + "_" + df_shifted["new_year"].astype(str) + "_" + df_shifted["new_month"].astype(str)
-        df_shifted["region_copy"] = df_shifted["region"]
-
-        merged = pd.merge(
-            df_shifted[["PM2.5", "new_key", "region_copy"]],
-            df[["key", "case_per_capita(‰)"]],
-            left_on="new_key",
-            right_on="key",
-            how="inner"
-        )
+    case_pm25_path = find_table(case_pm25_folder, f"{disease_name}_filtered_with_PM25")
+    if case_pm25_path is None:
+        return f"⚠️ 缺少檔案：{os.path.join(case_pm25_folder, disease_name)}_filtered_with_PM25"
+
+    series = load_series(case_pm25_path, "region", "month")
+
+    # 挑出 top5 Spearman lag，直接取用 9-3-2 已對齊的配對（快取不存在或來源已變動時才重新對齊）
+    top = correlation_df.head(TOP_K)
+    lags = top["平移量(月數)"].astype(int).tolist()
+    all_pairs = [cached_align(series, lag) for lag in lags]
+
+    rank_idx = np.concatenate([np.full(len(pairs.x), i) for i, pairs in enumerate(all_pairs)])
+    fits = region_fits(rank_idx,
+                       np.concatenate([pairs.units for pairs in all_pairs]),
+                       np.concatenate([pairs.x for pairs in all_pairs]),
+                       np.concatenate([pairs.y for pairs in all_pairs]),
+                       len(lags))
+
+    cache_path = os.path.join(PLOT_CACHE_DIR, f"{disease_name}.json")
+    previous = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    script_hash = file_hash(__file__)
+    hashes = {}
+    drawn = 0
+    for i, (lag, pearson, spearman, pairs) in enumerate(zip(lags, top["Pearson 係數"], top["Spearman 係數"], all_pairs)):
+        if len(pairs.x) < 10:
+            continue
 
-        if len(merged) < 10:
+        rank = i + 1
+        plot_filename = f"{disease_name}_spearman_rank{rank}_lag{lag}.png"
+        out_path = os.path.join(output_plot_folder, plot_filename)
+
+        # 輸入雜湊：來源資料、名次、平移量、係數、本程式與解析度
+        hashes[plot_filename] = hashlib.md5(json.dumps(
+            [series.source_hash, rank, lag, repr(pearson), repr(spearman), script_hash, SCATTER_DPI]
+        ).encode("utf-8")).hexdigest()
+        if previous.get(plot_filename) == hashes[plot_filename] and os.path.exists(out_path):
             continue
 
-        X = merged["PM2.5"].values.reshape(-1, 1)
-        y = merged["case_per_capita(‰)"].values
-        colors = merged["region_copy"].map(region_color_map)
-
-        # 繪製散布圖
-        plt.figure(figsize=(7, 6))
-        plt.scatter(X, y, alpha=0.6, c=colors)
-        plt.xlabel("PM2.5(μg/m³)")
-        plt.ylabel("就診人數(‰)")
-        plt.title(f"{disease_name}：lag={lag} 散布圖")
-
-        # 左上角文字顯示 Spearman 與 Pearson
-        stats_text = (
-            f"          總體\n"
-            f"Pearson: {pearson:.3f}\n"
-            f"Spearman: {spearman:.3f}"
-        )
-        plt.text(
-            0.02, 0.98,
-            stats_text,
-            transform=plt.gca().transAxes,
-            verticalalignment='top',
-            horizontalalignment='left',
-            fontsize=10,
-            bbox=dict(boxstyle="round", facecolor="white", alpha=0.7)
-        )
+        draw_plot(disease_name, lag, pearson, spearman, pairs, fits[fits["rank_idx"] == i], out_path)
+        drawn += 1
 
-        # 每個群集畫自己的線性回歸線，並記錄斜率
-        legend_elements = []
-        for region, color in region_color_map.items():
-            sub = merged[merged["region_copy"] == region]
-            if len(sub) < 2:
-                continue
-            X_sub = sub["PM2.5"].values.reshape(-1, 1)
-            y_sub = sub["case_per_capita(‰)"].values
-            reg = LinearRegression().fit(X_sub, y_sub)
-            slope = reg.coef_[0]
-            x_range = np.linspace(X_sub.min(), X_sub.max(), 100).reshape(-1, 1)
-            y_pred = reg.predict(x_range)
-            plt.plot(x_range, y_pred, color=color, linewidth=1.8)
-            
-            # 將斜率數值直接加到圖例標籤中
-            label_with_slope = f"{region} (m={slope:.4f})"
-            legend_elements.append(
-                Line2D([0], [0], marker='o', color='w', label=label_with_slope,
-                    markerfacecolor=color, markersize=8)
-            )
-
-        # 圖例顯示在右下角，含斜率
-        plt.legend(handles=legend_elements, title="區域", loc='lower right', frameon=True)
-
-        plt.tight_layout()
-
-        # 儲存圖檔
-        plot_filename = f"{disease_name}_spearman_rank{rank}_lag{lag}.png"
-        plt.savefig(os.path.join(output_plot_folder, plot_filename), dpi=300)
-        plt.close()
+    # 名次變動後不再產生的舊圖一併移除
+    for plot_filename in set(previous) - set(hashes):
+        stale_path = os.path.join(output_plot_folder, plot_filename)
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    os.makedirs(PLOT_CACHE_DIR, exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, ensure_ascii=False)
+
+    return f"✅ {disease_name}：重畫 {drawn} 張，沿用 {len(hashes) - drawn} 張"
 
-        print(f"{disease_name} rank {rank} lag {lag}繪製完成")
 
-print("✅ 所有疾病的相關性散布圖已完成（含顏色、圖例與群集回歸斜率）")
+if __name__ == "__main__":
+    run_per_file(process_file, correlation_folder)
+    print("✅ 所有疾病的相關性散布圖已完成（含顏色、圖例與群集回歸斜率）")
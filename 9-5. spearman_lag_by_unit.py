@@ -0,0 +1,55 @@
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+from parallel_runner import run_per_file
+from lag_engine import load_series, scan_lags_by_unit
+from table_io import list_tables, table_stem
+
+# 逐地區平移相關：每個鄉鎮（週資料）或每個 KMeans 分群（月資料，8-3. 的分組結果）各自計算每個平移量的 Spearman
+# 所有地區沿陣列軸一次排名與計算，輸出 地區 × 平移量 的相關矩陣與每個地區的最佳平移量（9-6. 依此著色）
+# 最少配對數取一年的期數，避免平移量大、配對少時的極端相關被選為最佳平移量
+modes = {
+    # 模式: (輸入資料夾, 地區欄位, 粒度, 平移量, 最少配對數)
+    "town": ("就診千分比對pm2.5(不補值)", "town", "week", range(1, 200), 52),
+    "cluster": (os.path.join("就診千分比對pm2.5(分組)", "cluster"), "group", "month", range(0, 40), 12),
+}
+
+# 輸出資料夾：lag_by_unit/{模式}/
+output_root = "lag_by_unit"
+
+
+# 處理單一檔案
+def process_file(mode, file_name):
+    input_folder, unit_col, granularity, lags, min_pairs = modes[mode]
+    series = load_series(os.path.join(input_folder, file_name), unit_col, granularity)
+    corr, n_pairs = scan_lags_by_unit(series, lags, min_pairs=min_pairs)
+
+    stem = table_stem(file_name)
+    output_folder = os.path.join(output_root, mode)
+    corr.rename_axis(unit_col).to_csv(os.path.join(output_folder, f"{stem}_lag_matrix.csv"), encoding="utf-8-sig")
+
+    # 每個地區 Spearman 最高的平移量（所有平移量都沒有足夠配對的地區略過）
+    valid = corr.notna().any(axis=1).to_numpy()
+    values = corr.to_numpy()[valid]
+    best_idx = np.nanargmax(values, axis=1)
+    rows = np.arange(len(best_idx))
+    best = pd.DataFrame({
+        unit_col: corr.index[valid],
+        "最佳平移量": corr.columns[best_idx],
+        "Spearman 係數": values[rows, best_idx],
+        "配對數": n_pairs.to_numpy()[valid][rows, best_idx],
+    })
+    best.to_csv(os.path.join(output_folder, f"{stem}_best_lag.csv"), index=False, encoding="utf-8-sig")
+
+    return f"✅ 完成：{mode} / {file_name}"
+
+
+if __name__ == "__main__":
+    for mode, (input_folder, *_) in modes.items():
+        if not os.path.isdir(input_folder):
+            print(f"⚠️ 找不到 {input_folder}，略過 {mode} 模式")
+            continue
+        os.makedirs(os.path.join(output_root, mode), exist_ok=True)
+        run_per_file(partial(process_file, mode), input_folder, filenames=list_tables(input_folder))
+    print(f"✅ 逐地區平移分析已完成，結果儲存在 {output_root}/")
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from matplotlib.patches import Patch
+import os
+from parallel_runner import run_per_file
+from town_dim import name_to_key
+from town_map import MAP_FORMAT, color_lookup, dim, get_canvas, save_map, unmatched_color
+
+# 依 9-5. 的各鄉鎮最佳平移量（週）著色，底圖與 7. 共用（town_map.py）
+input_folder = os.path.join("lag_by_unit", "town")
+output_folder = "最佳平移量地圖"
+os.makedirs(output_folder, exist_ok=True)
+
+# 最佳平移量分段（週，含兩端）與色碼
+lag_bins = [
+    (1, 4, '#08306B', '1-4 週'),
+    (5, 13, '#2171B5', '5-13 週'),
+    (14, 26, '#6BAED6', '14-26 週'),
+    (27, 52, '#FD8D3C', '27-52 週'),
+    (53, 199, '#D94801', '53 週以上'),
+]
+no_positive_color = '#A9A9A9'  # 深灰（最佳平移量的 Spearman 不為正）
+
+# === 手動圖例 ===
+legend_elements = [Patch(facecolor=color, edgecolor='black', label=label) for _, _, color, label in lag_bins] + [
+    Patch(facecolor=no_positive_color, edgecolor='black', label='無正相關'),
+    Patch(facecolor=unmatched_color, edgecolor='black', label='未對應地名／配對不足'),
+]
+
+
+# 畫出單一疾病的最佳平移量地圖
+def process_file(filename):
+    best = pd.read_csv(os.path.join(input_folder, filename))
+    disease_name = filename.replace("_best_lag.csv", "")
+    get_canvas(legend_elements, "最佳平移量")
+
+    lag = best['最佳平移量'].to_numpy()
+    colors = np.select([(lag >= low) & (lag <= high) for low, high, _, _ in lag_bins],
+                       [color for _, _, color, _ in lag_bins], default=unmatched_color)
+    colors = np.where(best['Spearman 係數'].to_numpy() > 0, colors, no_positive_color)
+
+    out_path = os.path.join(output_folder, f"{disease_name}_best_lag_map.{MAP_FORMAT}")
+    save_map(color_lookup(name_to_key(best['town'], dim), colors), f"{disease_name} - 最佳平移量", out_path)
+    return f"✅ 已輸出地圖：{out_path}"
+
+
+if __name__ == "__main__":
+    run_per_file(process_file, input_folder, suffix="_best_lag.csv")
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy import sparse
+from dlnm import CrossBasis, fit_poisson
+from parallel_runner import run_per_file
+from table_io import load_table, table_stem
+from town_dim import load_town_dim, name_to_key
+from week_tensor import WEEKS, load_tensor
+
+# 設定中文字體
+plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'SimHei', 'Microsoft YaHei', 'STHeiti']
+plt.rcParams['axes.unicode_minus'] = False
+
+# DLNM：所有鄉鎮、所有滯後期一起配適
+# log E[病例數] = log(在保人數) + 鄉鎮固定效應 + 年 + 季節（週次諧波） + PM2.5 × 滯後 交叉基底
+input_folder = "補值後CSV"   # 週病例數（以 week_tensor 張量讀取）
+pm25_path = "PM25_weekly_by_town.csv"
+pop_csv_path = "./各鄉鎮在保人數分布/total_population_2016_2019.csv"
+output_folder = "DLNM結果"
+os.makedirs(output_folder, exist_ok=True)
+
+# 最大滯後週數（可用環境變數 DLNM_MAX_LAG 調整）、季節諧波數
+MAX_LAG = int(os.environ.get("DLNM_MAX_LAG", 8))
+N_HARMONICS = 3
+
+# 累積相對風險曲線：參考濃度取 PM2.5 第 10 百分位，曲線範圍為第 1～99 百分位
+REFERENCE_QUANTILE = 0.1
+GRID_QUANTILES = (0.01, 0.99)
+GRID_SIZE = 50
+
+
+# === 1. PM2.5 排成與病例張量相同的 (鄉鎮 × 絕對週數) 陣列 ===
+def load_exposure(towns, years):
+    dim = load_town_dim()
+    pm25 = load_table(pm25_path, columns=['town', 'year', 'week', 'PM2.5'], cache=True)
+    pm25['town_key'] = name_to_key(pm25['town'], dim)
+    pm25 = pm25[pm25['town_key'] >= 0].groupby(['town_key', 'year', 'week'], as_index=False)['PM2.5'].mean()
+    pm25['ID1_CITY'] = dim['ID1_CITY'].to_numpy()[pm25['town_key']]
+    pm25 = pm25[pm25['ID1_CITY'].isin(towns) & pm25['year'].isin(years)]
+
+    exposure = np.full((len(towns), len(years), WEEKS), np.nan)
+    exposure[np.searchsorted(towns, pm25['ID1_CITY'].to_numpy()),
+             np.searchsorted(years, pm25['year'].to_numpy()),
+             pm25['week'].to_numpy() - 1] = pm25['PM2.5'].to_numpy()
+    exposure = exposure.reshape(len(towns), -1)
+
+    # 前後兩週都有值的單週缺值（例如該週沒有測值）以前後平均補上，避免滯後序列中斷
+    left = np.full_like(exposure, np.nan)
+    right = np.full_like(exposure, np.nan)
+    left[:, 1:] = exposure[:, :-1]
+    right[:, :-1] = exposure[:, 1:]
+    gap = np.isnan(exposure) & ~np.isnan(left) & ~np.isnan(right)
+    exposure[gap] = (left[gap] + right[gap]) / 2
+    return exposure
+
+
+# === 2. log(在保人數) offset，(鄉鎮 × 絕對週數) ===
+def load_log_pop(towns, years):
+    pop_df = load_table(pop_csv_path, columns=['ID1_CITY', 'year', 'total_pop'], cache=True)
+    pop = pop_df.set_index(['ID1_CITY', 'year'])['total_pop'].reindex(
+        pd.MultiIndex.from_product([towns, years])
+    ).to_numpy(dtype=float).reshape(len(towns), len(years))
+    return np.log(np.repeat(pop, WEEKS, axis=1))
+
+
+# === 3. 設計矩陣：鄉鎮固定效應為稀疏 one-hot，其餘為少數密集欄位 ===
+def design_matrix(town_idx, period_idx, n_years, crossbasis_cols):
+    towns, town_codes = np.unique(town_idx, return_inverse=True)
+    town_onehot = sparse.csr_matrix(
+        (np.ones(len(town_codes)), (np.arange(len(town_codes)), town_codes)), shape=(len(town_codes), len(towns))
+    )
+
+    year = period_idx // WEEKS
+    year_dummies = (year[:, None] == np.arange(1, n_years)).astype(float)
+
+    angle = 2 * np.pi * (period_idx % WEEKS) / 52.18
+    harmonics = np.column_stack([f(k * angle) for k in range(1, N_HARMONICS + 1) for f in (np.sin, np.cos)])
+
+    dense = np.column_stack([year_dummies, harmonics, crossbasis_cols])
+    return sparse.hstack([town_onehot, sparse.csr_matrix(dense)]).tocsr()
+
+
+# === 4. 單一疾病：配適並輸出累積相對風險曲線 ===
+def process_file(filename):
+    tensor = load_tensor(input_folder)
+    d = tensor.files.index(filename)
+    disease_name = table_stem(filename)
+
+    exposure = load_exposure(tensor.towns, tensor.years)
+    log_pop = load_log_pop(tensor.towns, tensor.years)
+    cases = np.asarray(tensor.values[d]).reshape(len(tensor.towns), -1)
+
+    basis = CrossBasis(exposure, MAX_LAG)
+    crossbasis, complete = basis.transform(exposure)
+    rows = complete & ~np.isnan(cases) & ~np.isnan(log_pop)
+    town_idx, period_idx = np.nonzero(rows)
+
+    X = design_matrix(town_idx, period_idx, len(tensor.years), crossbasis[town_idx, period_idx])
+    coef, cov, dispersion = fit_poisson(X, cases[rows], log_pop[rows])
+
+    # 交叉基底在設計矩陣最後 n_columns 欄
+    cb_coef = coef[-basis.n_columns:]
+    cb_cov = cov[-basis.n_columns:, -basis.n_columns:]
+
+    values = exposure[~np.isnan(exposure)]
+    reference = np.quantile(values, REFERENCE_QUANTILE)
+    grid = np.linspace(*np.quantile(values, GRID_QUANTILES), GRID_SIZE)
+    contrast = basis.cumulative_contrast(grid, reference)
+    log_rr = contrast @ cb_coef
+    se = np.sqrt(np.einsum('ij,jk,ik->i', contrast, cb_cov, contrast))
+
+    result = pd.DataFrame({
+        'PM2.5': grid.round(2),
+        'RR': np.exp(log_rr).round(4),
+        'RR_low': np.exp(log_rr - 1.96 * se).round(4),
+        'RR_high': np.exp(log_rr + 1.96 * se).round(4),
+    })
+    result.to_csv(os.path.join(output_folder, f"{disease_name}_cumulative_RR.csv"), index=False, encoding="utf-8-sig")
+
+    # 累積相對風險曲線圖
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.fill_between(grid, result['RR_low'], result['RR_high'], color='tab:red', alpha=0.2)
+    ax.plot(grid, result['RR'], color='tab:red')
+    ax.axhline(1, color='black', linewidth=0.8)
+    ax.axvline(reference, color='gray', linestyle='--', linewidth=0.8)
+    ax.set_title(f"{disease_name} - PM2.5 累積相對風險（滯後 0-{MAX_LAG} 週）")
+    ax.set_xlabel("PM2.5")
+    ax.set_ylabel("RR")
+    fig.savefig(os.path.join(output_folder, f"{disease_name}_cumulative_RR.png"), dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+    return f"✅ 完成：{disease_name}（{len(town_idx)} 筆，離散度 {dispersion:.2f}）"
+
+
+if __name__ == "__main__":
+    # 先在主行程建立張量快取，避免子行程同時重建
+    tensor = load_tensor(input_folder)
+    run_per_file(process_file, input_folder, filenames=tensor.files)
@@ -1,7 +1,9 @@
 import os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.stats import pearsonr, spearmanr, kendalltau
+from scipy.stats import kendalltau
+from table_io import list_tables, load_table, table_stem
 
 # 設定中文字體
 plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'SimHei', 'Microsoft YaHei', 'STHeiti']
@@ -10,50 +12,90 @@ plt.rcParams['axes.unicode_minus'] = False
 # 設定資料夾路徑
 folder_path = "就診千分比對pm2.5(不補值)"
 
-# 建立輸出圖表資料夾
+# 所有疾病 × 年份的相關係數彙整表
+summary_path = "correlation_by_year_no_fill.csv"
+
+# 散布圖改為需要時才畫：環境變數 CORR_PLOTS 設為 all（全部疾病）或以逗號分隔的疾病名稱，未設定則不畫
+CORR_PLOTS = os.environ.get("CORR_PLOTS", "")
 output_dir = "scatter_plots_no_fill"
-os.makedirs(output_dir, exist_ok=True)
-
-# 遍歷所有 csv 檔案
-for file_name in os.listdir(folder_path):
-    if file_name.endswith(".csv"):
-        file_path = os.path.join(folder_path, file_name)
-        df = pd.read_csv(file_path)
-
-        # 移除缺失值
-        df = df[["year", "case_per_capita(‰)", "PM2.5"]].dropna()
-
-        # 依照年份分組
-        for year, group in df.groupby("year"):
-            if group.empty:
-                continue
-
-            # 計算三種相關係數
-            pearson_corr, _ = pearsonr(group["case_per_capita(‰)"], group["PM2.5"])
-            spearman_corr, _ = spearmanr(group["case_per_capita(‰)"], group["PM2.5"])
-            kendall_corr, _ = kendalltau(group["case_per_capita(‰)"], group["PM2.5"])
-
-            # 畫圖
-            plt.figure(figsize=(16, 9))
-            plt.scatter(group["PM2.5"], group["case_per_capita(‰)"], alpha=0.5)
-            disease_name = file_name[:-4]
-            plt.title(f"{disease_name}（{year}年）: 就診千分比 vs PM2.5")
-            plt.xlabel("PM2.5")
-            plt.ylabel("就診人數千分比 (‰)")
-
-            # 標註相關係數
-            plt.text(
-                0.05, 0.95,
-                f"Pearson: {pearson_corr:.2f}\nSpearman: {spearman_corr:.2f}\nKendall Tau: {kendall_corr:.2f}",
-                transform=plt.gca().transAxes,
-                fontsize=10,
-                verticalalignment="top",
-                bbox=dict(facecolor="white", alpha=0.7)
-            )
-
-            # 儲存圖檔
-            output_path = os.path.join(output_dir, f"{disease_name}_{year}_scatter.png")
-            plt.savefig(output_path)
-            plt.close()
-
-print("依疾病與年份分析與圖表已完成，結果儲存在 scatter_plots_by_year 資料夾中。")
+
+# 點數超過 HEXBIN_MIN_POINTS 時改畫 hexbin 密度圖，否則畫點（點以點陣化輸出，檔案不隨點數變大）
+HEXBIN_MIN_POINTS = 2000
+PLOT_DPI = 150
+
+
+# 依 (疾病, 年份) 分組一次算出 Pearson：以分組平均置中後，分組加總乘積
+def grouped_pearson(df, keys, x_col, y_col):
+    g = df.groupby(keys, observed=True, sort=False)
+    xc = df[x_col] - g[x_col].transform("mean")
+    yc = df[y_col] - g[y_col].transform("mean")
+    sums = pd.DataFrame({"xy": xc * yc, "xx": xc * xc, "yy": yc * yc}) \
+        .groupby([df[k] for k in keys], observed=True).sum()
+    return sums["xy"] / np.sqrt(sums["xx"] * sums["yy"])
+
+
+def correlation_table(df):
+    keys = ["疾病", "year"]
+    ranks = df.groupby(keys, observed=True, sort=False)[["case_per_capita(‰)", "PM2.5"]].rank()
+    ranks[keys] = df[keys]
+
+    summary = pd.DataFrame({
+        "配對數": df.groupby(keys, observed=True).size(),
+        "Pearson 係數": grouped_pearson(df, keys, "case_per_capita(‰)", "PM2.5"),
+        "Spearman 係數": grouped_pearson(ranks, keys, "case_per_capita(‰)", "PM2.5"),
+        # Kendall tau-b 沒有分組向量化的寫法，每組呼叫一次 O(n log n) 的 scipy 實作
+        "Kendall Tau": df.groupby(keys, observed=True).apply(
+            lambda group: kendalltau(group["case_per_capita(‰)"], group["PM2.5"])[0]
+        ),
+    })
+    return summary.reset_index().rename(columns={"year": "年份"})
+
+
+def draw_plot(disease_name, year, group, row):
+    fig, ax = plt.subplots(figsize=(8, 4.5))
+    if len(group) >= HEXBIN_MIN_POINTS:
+        hb = ax.hexbin(group["PM2.5"], group["case_per_capita(‰)"], gridsize=60, mincnt=1, bins="log", cmap="viridis")
+        fig.colorbar(hb, ax=ax, label="點數")
+    else:
+        ax.scatter(group["PM2.5"], group["case_per_capita(‰)"], alpha=0.5, rasterized=True)
+    ax.set_title(f"{disease_name}（{year}年）: 就診千分比 vs PM2.5")
+    ax.set_xlabel("PM2.5")
+    ax.set_ylabel("就診人數千分比 (‰)")
+
+    # 標註相關係數
+    ax.text(
+        0.05, 0.95,
+        f"Pearson: {row['Pearson 係數']:.2f}\nSpearman: {row['Spearman 係數']:.2f}\nKendall Tau: {row['Kendall Tau']:.2f}",
+        transform=ax.transAxes,
+        fontsize=10,
+        verticalalignment="top",
+        bbox=dict(facecolor="white", alpha=0.7)
+    )
+
+    # 儲存圖檔
+    fig.savefig(os.path.join(output_dir, f"{disease_name}_{year}_scatter.png"), dpi=PLOT_DPI)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    # 所有疾病讀成一張長表（只讀需要的欄位），移除缺失值
+    frames = []
+    for file_name in list_tables(folder_path):
+        df = load_table(os.path.join(folder_path, file_name), columns=["year", "case_per_capita(‰)", "PM2.5"]).dropna()
+        df["疾病"] = table_stem(file_name)
+        frames.append(df)
+    data = pd.concat(frames, ignore_index=True)
+    data["疾病"] = data["疾病"].astype("category")
+
+    summary = correlation_table(data)
+    summary.to_csv(summary_path, index=False, encoding="utf-8-sig")
+    print(f"✅ 依疾病與年份的相關係數已輸出：{summary_path}")
+
+    if CORR_PLOTS:
+        selected = None if CORR_PLOTS == "all" else {name.strip() for name in CORR_PLOTS.split(",")}
+        os.makedirs(output_dir, exist_ok=True)
+        groups = data.groupby(["疾病", "year"], observed=True)
+        for row in summary.to_dict("records"):
+            if selected is None or row["疾病"] in selected:
+                draw_plot(row["疾病"], row["年份"], groups.get_group((row["疾病"], row["年份"])), row)
+        print(f"✅ 散布圖已輸出至 {output_dir} 資料夾")
@@ -0,0 +1,89 @@
+import numpy as np
+from scipy import sparse
+from scipy.interpolate import BSpline
+from scipy.linalg import cho_factor, cho_solve
+
+# 分布滯後非線性模型（DLNM）：暴露 × 滯後 的交叉基底，以稀疏設計矩陣做 Poisson IRLS，離散度另以 quasi-Poisson 估計
+# 交叉基底欄位順序：暴露基底 i、滯後基底 j → 第 i * 滯後基底數 + j 欄
+
+
+# B-spline 基底矩陣，超出邊界的值夾在邊界上
+def bspline_basis(x, knots, boundary, degree=2):
+    t = np.r_[[boundary[0]] * (degree + 1), knots, [boundary[1]] * (degree + 1)]
+    return BSpline.design_matrix(np.clip(x, *boundary), t, degree).toarray()
+
+
+# 暴露與滯後的基底設定：暴露以分位數為內部節點，滯後以對數等距為內部節點
+class CrossBasis:
+    def __init__(self, exposure, max_lag, var_quantiles=(0.25, 0.5, 0.75), lag_knots=2, degree=2):
+        values = exposure[~np.isnan(exposure)]
+        self.max_lag = max_lag
+        self.degree = degree
+        self.var_boundary = (float(values.min()), float(values.max()))
+        self.var_knots = np.quantile(values, var_quantiles)
+        self.lag_boundary = (0.0, float(max_lag))
+        self.lag_knots = np.logspace(0, np.log10(max(max_lag, 1)), lag_knots + 2)[1:-1] if max_lag > 1 else []
+
+        # 滯後基底含截距；暴露基底去掉第一欄（B-spline 各欄相加為 1，截距由地區固定效應吸收）
+        self.lag_basis = bspline_basis(np.arange(max_lag + 1, dtype=float), self.lag_knots, self.lag_boundary, degree)
+
+    def var_basis(self, x):
+        return bspline_basis(x, self.var_knots, self.var_boundary, self.degree)[:, 1:]
+
+    @property
+    def n_columns(self):
+        return (len(self.var_knots) + self.degree) * self.lag_basis.shape[1]
+
+    # exposure 為 (地區 × 期數)，回傳 (地區 × 期數 × 欄位) 的交叉基底與「所有滯後期都有暴露值」的遮罩
+    def transform(self, exposure):
+        n_units, n_periods = exposure.shape
+        present = ~np.isnan(exposure)
+
+        var = np.zeros((n_units, n_periods, len(self.var_knots) + self.degree))
+        var[present] = self.var_basis(exposure[present])
+
+        columns = np.zeros((n_units, n_periods, var.shape[2], self.lag_basis.shape[1]))
+        complete = np.ones((n_units, n_periods), dtype=bool)
+        complete[:, :self.max_lag] = False
+        for lag in range(self.max_lag + 1):
+            # t 期的第 lag 期滯後為 t - lag 期的暴露
+            shifted = var[:, :n_periods - lag]
+            columns[:, lag:] += shifted[..., None] * self.lag_basis[lag]
+            complete[:, lag:] &= present[:, :n_periods - lag]
+
+        return columns.reshape(n_units, n_periods, -1), complete
+
+    # 相對於 reference 的累積（所有滯後加總）log RR 線性組合，每列對應 grid 中一個暴露值
+    def cumulative_contrast(self, grid, reference):
+        diff = self.var_basis(np.asarray(grid, dtype=float)) - self.var_basis(np.array([reference], dtype=float))
+        return np.kron(diff, self.lag_basis.sum(axis=0)[None, :])
+
+
+# Poisson IRLS（log link，含 offset），設計矩陣為 scipy 稀疏矩陣；回傳係數、共變異（已乘上 quasi-Poisson 離散度）、離散度
+def fit_poisson(X, y, offset, max_iter=50, tol=1e-8):
+    X = sparse.csr_matrix(X)
+    mu = y + 0.1
+    eta = np.log(mu)
+    deviance = np.inf
+
+    for _ in range(max_iter):
+        z = eta - offset + (y - mu) / mu
+        XtW = X.T.multiply(mu).tocsr()
+        info = (XtW @ X).toarray()
+        coef = cho_solve(cho_factor(info), XtW @ z)
+
+        eta = X @ coef + offset
+        mu = np.exp(eta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new_deviance = 2 * np.sum(np.where(y > 0, y * np.log(y / mu), 0.0) - (y - mu))
+        converged = abs(new_deviance - deviance) / (abs(new_deviance) + 0.1) < tol
+        deviance = new_deviance
+        if converged:
+            break
+
+    # 以收斂時的權重計算共變異
+    XtW = X.T.multiply(mu).tocsr()
+    info = (XtW @ X).toarray()
+    dispersion = float(np.sum((y - mu) ** 2 / mu) / (len(y) - X.shape[1]))
+    cov = cho_solve(cho_factor(info), np.eye(X.shape[1])) * dispersion
+    return coef, cov, dispersion
@@ -0,0 +1,61 @@
+import re
+from collections import defaultdict
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# 從工作表名稱擷取病名（去除年份）
+def disease_of(sheet_name):
+    match = re.match(r"(.+?)\s*\d{4}$", sheet_name)
+    return match.group(1).strip() if match else sheet_name
+
+
+# Excel 中的整數可能存成浮點數，比照 pandas 讀取時轉回整數
+def cell_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# 以唯讀模式逐列讀取就醫人數活頁簿，依病名合併 sex 並累加 case_c
+# period_col 為 "month" 或 "week"；keep_city(city_id) 回傳 False 的鄉鎮在讀取時即略過
+# 同一病名的工作表都讀完就產出 (病名, DataFrame)，不需把整本活頁簿留在記憶體
+def stream_disease_totals(excel_path, period_col, keep_city=None):
+    key_cols = ['ID1_CITY', 'year', period_col]
+    wb = load_workbook(excel_path, read_only=True)
+
+    # 每個病名的最後一張工作表，處理完就可以先輸出
+    last_sheet = {disease_of(sheet_name): sheet_name for sheet_name in wb.sheetnames}
+
+    # 每個病名的累加器：(ID1_CITY, year, period) → case_c
+    disease_totals = defaultdict(lambda: defaultdict(int))
+
+    try:
+        for sheet_name in wb.sheetnames:
+            disease_name = disease_of(sheet_name)
+            totals = disease_totals[disease_name]
+
+            rows = wb[sheet_name].iter_rows(values_only=True)
+            header = {name: i for i, name in enumerate(next(rows))}
+            id_col, year_col, period_idx, case_col = (header[c] for c in key_cols + ['case_c'])
+
+            for row in rows:
+                # 任一分組欄位空白就略過（與 groupby 預設丟棄缺值鍵相同），case_c 缺值視為 0（與 groupby.sum 相同）
+                if row[id_col] is None or row[year_col] is None or row[period_idx] is None:
+                    continue
+                city_id = str(cell_value(row[id_col])).zfill(4)
+                if keep_city is not None and not keep_city(city_id):
+                    continue
+                key = (city_id, cell_value(row[year_col]), cell_value(row[period_idx]))
+                totals[key] += cell_value(row[case_col]) or 0
+
+            if last_sheet[disease_name] == sheet_name:
+                combined_df = pd.DataFrame(
+                    [(*key, case_c) for key, case_c in sorted(totals.items())],
+                    columns=key_cols + ['case_c']
+                )
+                del disease_totals[disease_name]
+                yield disease_name, combined_df
+    finally:
+        wb.close()
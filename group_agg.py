@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# 任意分組的聚合層：將鄉鎮資料排成 (鄉鎮 × 年 × 期數) 網格，每種分組建一個稀疏的 0/1 分組矩陣
+# 一次矩陣乘法即可得到各組病例數、人口數與人口加權 PM2.5，換分組只需換矩陣
+
+# 五大地區：依據 ID1_CITY 前兩碼對應縣市
+REGION_GROUPS = {
+    '北北基桃竹苗': ['01', '31', '11', '32', '33', '35'],   # 台北、新北、基隆、桃園、新竹、苗栗
+    '中彰投':     ['03', '37', '38'],                      # 台中、彰化、南投
+    '雲嘉南':     ['39', '40', '05'],                      # 雲林、嘉義、台南
+    '高屏':       ['07', '43'],                            # 高雄、屏東
+    '宜花東':     ['34', '45', '46']                       # 宜蘭、花蓮、台東
+}
+
+# 反向映射：ID1_CITY 前兩碼 → 地區名稱
+CITY_TO_REGION = {prefix: region for region, prefixes in REGION_GROUPS.items() for prefix in prefixes}
+
+
+# === 分組定義：回傳 DataFrame（ID1_CITY、group，逐年不同的分組另有 year 欄） ===
+def region_grouping(towns):
+    towns = pd.Series(towns, dtype=str)
+    return pd.DataFrame({'ID1_CITY': towns, 'group': towns.str[:2].map(CITY_TO_REGION)})
+
+
+# 縣市：取 C_NAME 前三字（例如 臺北市、南投縣）
+def county_grouping(code_map):
+    return pd.DataFrame({'ID1_CITY': code_map['ID1_CITY'], 'group': code_map['C_NAME'].str.strip().str[:3]})
+
+
+# KMeans 分群（分群結果/{疾病}_分群地區.csv），每年的分群不同
+def cluster_grouping(cluster_path, exclude=(6,)):
+    cluster_df = pd.read_csv(cluster_path, dtype={'city_id': str})
+    cluster_df = cluster_df[~cluster_df['cluster'].isin(exclude)]
+    return pd.DataFrame({
+        'ID1_CITY': cluster_df['city_id'],
+        'year': cluster_df['year'],
+        'group': 'cluster ' + cluster_df['cluster'].astype(str),
+    })
+
+
+# 鄉鎮 × 年 × 期數 的完整網格
+def town_grid(towns, years, n_periods):
+    return pd.MultiIndex.from_product(
+        [np.asarray(towns, dtype=str), np.asarray(years), np.arange(1, n_periods + 1)],
+        names=['ID1_CITY', 'year', 'period']
+    )
+
+
+# 將長表的欄位排到網格上（網格中沒有的資料為 NaN）
+def to_grid(grid, df, value_col, period_col):
+    keys = pd.MultiIndex.from_arrays(
+        [df['ID1_CITY'].astype(str), df['year'], df[period_col]], names=['ID1_CITY', 'year', 'period']
+    )
+    return pd.Series(df[value_col].to_numpy(dtype=float), index=keys).reindex(grid).to_numpy()
+
+
+# 分組矩陣：(組 × 年 × 期數) × 網格，未分組的鄉鎮整欄為 0
+def group_matrix(grid, grouping):
+    cells = grid.to_frame(index=False)
+    on = ['ID1_CITY', 'year'] if 'year' in grouping.columns else ['ID1_CITY']
+    cells = cells.merge(grouping.dropna(subset=['group']), on=on, how='left')
+
+    assigned = cells['group'].notna().to_numpy()
+    keys = cells.loc[assigned, ['group', 'year', 'period']]
+    codes, uniques = pd.MultiIndex.from_frame(keys).factorize(sort=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(codes)), (codes, np.flatnonzero(assigned))), shape=(len(uniques), len(grid))
+    )
+    return uniques.to_frame(index=False, name=list(keys.columns)), matrix
+
+
+# 各組加總：case 為網格上的病例數（NaN 表示該鄉鎮該期沒有資料），pop 為網格上的人口數
+# 只計入同時有病例與人口資料的鄉鎮；有 pm25 時另計人口加權平均（只計入有 PM2.5 的鄉鎮）
+def aggregate(keys, matrix, case, pop, pm25=None):
+    present = ~np.isnan(case) & ~np.isnan(pop)
+    pop = np.where(present, pop, 0.0)
+    columns = [np.where(present, case, 0.0), pop, present.astype(float)]
+    if pm25 is not None:
+        has_pm = present & ~np.isnan(pm25)
+        columns += [np.where(has_pm, pop * np.nan_to_num(pm25), 0.0), np.where(has_pm, pop, 0.0)]
+
+    sums = matrix @ np.column_stack(columns)
+
+    result = keys.copy()
+    result['case_c'] = sums[:, 0]
+    result['pop_total'] = sums[:, 1]
+    result['case_per_capita(‰)'] = (result['case_c'] / result['pop_total'] * 1000).round(3)
+    if pm25 is not None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['PM2.5'] = (sums[:, 3] / sums[:, 4]).round(2)
+
+    # 只保留有資料的組別與期數
+    return result[sums[:, 2] > 0].reset_index(drop=True)
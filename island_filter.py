@@ -0,0 +1,14 @@
+# 外島鄉鎮代碼：澎湖縣（44 開頭）、臺東縣綠島鄉（4611）、臺東縣蘭嶼鄉（4616）
+EXCLUDED_PREFIX = "44"
+EXCLUDED_IDS = ["4611", "4616"]
+
+
+# 單一代碼判斷（逐列讀取時使用）
+def is_outlying_island(city_id):
+    return city_id.startswith(EXCLUDED_PREFIX) or city_id in EXCLUDED_IDS
+
+
+# 移除 DataFrame 中的外島列
+def drop_outlying_islands(df, id_col="ID1_CITY"):
+    ids = df[id_col].astype(str)
+    return df[~ids.str.startswith(EXCLUDED_PREFIX) & ~ids.isin(EXCLUDED_IDS)]
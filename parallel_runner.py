@@ -0,0 +1,59 @@
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 預設工作行程數，可用環境變數 N_WORKERS 調整（設為 1 即依序執行）
+N_WORKERS = int(os.environ.get("N_WORKERS", os.cpu_count() or 1))
+
+# 由 pipeline.py 設定：只重跑輸入有變動的檔案，並回報各檔案成功與否
+PIPELINE_FILES = os.environ.get("PIPELINE_FILES")
+PIPELINE_REPORT = os.environ.get("PIPELINE_REPORT")
+
+
+# 在子行程中執行單一檔案，捕捉例外以免中斷其他檔案
+def _run_one(process_file, filename):
+    try:
+        return True, process_file(filename)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+# 將資料夾中每個疾病檔案交給 process_file(filename) 平行處理
+# process_file 需定義在模組最上層，回傳完成訊息（例如 "✅ 已輸出：..."）
+# filenames 可直接指定要處理的檔案（例如 table_io.list_tables 的結果），否則依 suffix 篩選
+# 回傳失敗清單 [(filename, 錯誤訊息), ...]
+def run_per_file(process_file, input_folder, suffix=".csv", n_workers=N_WORKERS, filenames=None):
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(input_folder) if f.endswith(suffix))
+    if PIPELINE_FILES is not None:
+        selected = set(json.loads(PIPELINE_FILES))
+        filenames = [f for f in filenames if f in selected]
+    failures = []
+
+    def report(filename, ok, result):
+        if ok:
+            if result:
+                print(result)
+        else:
+            print(f"❌ 處理失敗：{filename}\n{result}")
+            failures.append((filename, result))
+
+    if n_workers <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            report(filename, *_run_one(process_file, filename))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(filenames))) as pool:
+            futures = {pool.submit(_run_one, process_file, filename): filename for filename in filenames}
+            for future in as_completed(futures):
+                report(futures[future], *future.result())
+
+    if failures:
+        print(f"⚠️ 共 {len(failures)} 個檔案處理失敗：{', '.join(name for name, _ in failures)}")
+
+    if PIPELINE_REPORT is not None:
+        failed = {name for name, _ in failures}
+        with open(PIPELINE_REPORT, "w", encoding="utf-8") as f:
+            json.dump({"succeeded": [name for name in filenames if name not in failed],
+                       "failed": sorted(failed)}, f, ensure_ascii=False)
+    return failures
@@ -0,0 +1,282 @@
+import argparse
+import ast
+import csv
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from table_io import list_tables
+
+# 各階段宣告：腳本、輸入、輸出
+# per_file_folder 不為 None 時，該階段可只重跑輸入有變動的疾病檔案（腳本需使用 parallel_runner.run_per_file）
+# inputs 中的其他檔案/資料夾視為共用輸入，變動時該階段所有疾病都重跑
+# env 為執行腳本時額外設定的環境變數（同一支腳本以不同輸入跑成多個階段時使用）
+Stage = namedtuple("Stage", ["name", "script", "inputs", "outputs", "per_file_folder", "suffix", "env"],
+                   defaults=[None])
+
+MONTHLY_XLSX = "./每月呼吸道疾病就醫人數/2016-2019 年每月呼吸道疾病就醫人數.xlsx"
+WEEKLY_XLSX = "./每週呼吸道疾病就醫人數/2016-2019 年每週呼吸道疾病就醫人數.xlsx"
+POPULATION_XLSX = "./各鄉鎮在保人數分布/2016-2019 年各鄉鎮在保人數分布.xlsx"
+POPULATION_CSV = "./各鄉鎮在保人數分布/total_population_2016_2019.csv"
+
+# 原始資料：不由任何階段產生的輸入（程式碼 .py 之外）必須列在這裡，否則視為 DAG 設定錯誤
+RAW_SOURCES = [MONTHLY_XLSX, WEEKLY_XLSX, POPULATION_XLSX, "PM25_raw", "TOWN_MOI_1131028.gml"]
+
+STAGES = [
+    Stage("1", "1. add_sex&merge.py", [MONTHLY_XLSX, "excel_ingest.py"], ["月-呼吸道疾病就醫人數"], None, None),
+    Stage("1-2", "1-2. population_merge.py", [POPULATION_XLSX, "excel_ingest.py"], [POPULATION_CSV], None, None),
+    Stage("2", "2. take_cityid&name.py", [POPULATION_XLSX], ["ID_CNAME.csv"], None, None),
+    Stage("2-2", "2-2. pm25_resample.py", ["PM25_raw", "ID_CNAME.csv", POPULATION_CSV, "town_dim.py", "group_agg.py",
+                                           "island_filter.py", "table_io.py"],
+          ["PM25_weekly_by_town.csv", "PM25_monthly_by_town.csv", "PM25_monthly_by_region.csv"], None, None),
+    Stage("1-3", "1-3. weekly_add_sex&merge.py", [WEEKLY_XLSX, "excel_ingest.py", "island_filter.py"],
+          ["周-呼吸道疾病就醫人-移除外島"], None, None),
+    Stage("3", "3. filter_island.py", ["月-呼吸道疾病就醫人數", "island_filter.py"], ["月-呼吸道疾病就醫人數-移除外島"], None, None),
+    Stage("4", "4. find_missing.py", ["周-呼吸道疾病就醫人-移除外島"], ["少週數的.csv", "缺週區段.csv"], None, None,
+          {"MISSING_INPUT": "周-呼吸道疾病就醫人-移除外島"}),
+    Stage("5", "5. fill_if_27up.py", ["周-呼吸道疾病就醫人-移除外島", "缺週區段.csv"], ["補值後CSV"], None, None),
+    Stage("4-filled", "4. find_missing.py", ["補值後CSV"], ["少週數的_補值後.csv", "缺週區段_補值後.csv"], None, None,
+          {"MISSING_INPUT": "補值後CSV"}),
+    Stage("5-2", "5-2. convert_rates.py",
+          [POPULATION_CSV, "補值後CSV", "周-呼吸道疾病就醫人-移除外島", "月-呼吸道疾病就醫人數-移除外島", "group_agg.py"],
+          ["補值後轉發病比", "不補值轉發病比", "月就醫轉比例", "月就醫比例(五群)"], None, None),
+    Stage("6", "6. kmeans_k=5.py", ["week_tensor.py", "parallel_runner.py"], ["分群結果"], "補值後CSV", None),
+    Stage("7", "7. draw_map.py", ["TOWN_MOI_1131028.gml", "ID_CNAME.csv", "island_filter.py", "town_dim.py", "town_map.py",
+                                      "parallel_runner.py"],
+          ["分群地圖"], "分群結果", "_分群地區.csv"),
+    Stage("8", "8. merge_case_pm25.py", ["PM25_weekly_by_town.csv", "ID_CNAME.csv", "town_dim.py", "parallel_runner.py"],
+          ["就診千分比對pm2.5(不補值)"], "不補值轉發病比", None),
+    Stage("8-2", "8-2. merge_case&pm25_by_cluster.py", ["PM25_monthly_by_region.csv", "parallel_runner.py"],
+          ["就診千分比對pm2.5(五群)"], "月就醫比例(五群)", None),
+    Stage("8-3", "8-3. merge_case_pm25_by_group.py",
+          [POPULATION_CSV, "PM25_monthly_by_town.csv", "ID_CNAME.csv", "分群結果", "group_agg.py", "town_dim.py", "parallel_runner.py"],
+          ["就診千分比對pm2.5(分組)"], "月-呼吸道疾病就醫人數-移除外島", None),
+    Stage("9", "9. cal_corelaiton.py", ["就診千分比對pm2.5(不補值)"], ["correlation_by_year_no_fill.csv"], None, None),
+    Stage("9-2", "9-2. spearman_lag.py", ["lag_engine.py", "parallel_runner.py"],
+          ["lag_correlation_results"], "就診千分比對pm2.5(不補值)", None),
+    Stage("9-3", "9-3. lag_region+month.py", ["lag_engine.py", "parallel_runner.py"],
+          ["lag_corre_month+region(more indicater)"], "就診千分比對pm2.5(五群)", None),
+    Stage("9-3-2", "9-3-2. less indicater.py", ["lag_engine.py", "parallel_runner.py"],
+          ["lag_corre_month+region"], "就診千分比對pm2.5(五群)", None),
+    Stage("9-4", "9-4. plot_scatter.py",
+          ["lag_corre_month+region", "就診千分比對pm2.5(五群)", "lag_engine.py", "parallel_runner.py"],
+          ["scatter_plots_region_shift"], None, None),
+    Stage("9-5", "9-5. spearman_lag_by_unit.py",
+          ["就診千分比對pm2.5(不補值)", "就診千分比對pm2.5(分組)", "lag_engine.py", "parallel_runner.py"],
+          ["lag_by_unit"], None, None),
+    Stage("9-6", "9-6. draw_best_lag_map.py",
+          ["TOWN_MOI_1131028.gml", "ID_CNAME.csv", "island_filter.py", "town_dim.py", "town_map.py", "parallel_runner.py"],
+          ["最佳平移量地圖"], "lag_by_unit/town", "_best_lag.csv"),
+    Stage("9-7", "9-7. dlnm_pm25.py",
+          ["PM25_weekly_by_town.csv", POPULATION_CSV, "ID_CNAME.csv", "dlnm.py", "week_tensor.py", "town_dim.py",
+           "parallel_runner.py"],
+          ["DLNM結果"], "補值後CSV", None),
+]
+
+# 狀態與計時紀錄
+STATE_DIR = ".pipeline"
+STATE_PATH = os.path.join(STATE_DIR, "state.json")
+TIMING_PATH = os.path.join(STATE_DIR, "timing.csv")
+
+
+# 檔案內容雜湊；大小與修改時間沒變時沿用上次的結果，避免重複讀取大檔
+def file_hash(path, hash_cache):
+    stat = os.stat(path)
+    cached = hash_cache.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    hash_cache[path] = [stat.st_size, stat.st_mtime_ns, md5.hexdigest()]
+    return md5.hexdigest()
+
+
+# 多個檔案/資料夾合成一個指紋，資料夾以其中每個檔案的雜湊計算
+def fingerprint(paths, hash_cache):
+    hashes = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                file_path = os.path.join(path, filename)
+                if os.path.isfile(file_path):
+                    hashes[file_path] = file_hash(file_path, hash_cache)
+        else:
+            hashes[path] = file_hash(path, hash_cache)
+    return hashlib.md5(json.dumps(hashes, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# 腳本透過 import 用到的本地模組（遞迴追蹤，含函式內的 import），即使沒有列在 inputs 也納入指紋
+def local_imports(script, found=None):
+    found = set() if found is None else found
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            path = os.path.join(os.path.dirname(script), name.split(".")[0] + ".py")
+            if path not in found and os.path.isfile(path):
+                found.add(path)
+                local_imports(path, found)
+    return found
+
+
+# 檢查 DAG：每個輸入（含逐檔資料夾）必須是原始資料、程式碼，或由排在前面的階段產生（可為其輸出資料夾下的路徑）
+def check_dag(stages):
+    def covers(output, path):
+        return path == output or path.startswith(output + os.sep)
+
+    raw = {os.path.normpath(path) for path in RAW_SOURCES}
+    problems = []
+    produced = []
+    for stage in stages:
+        inputs = list(stage.inputs) + ([stage.per_file_folder] if stage.per_file_folder else [])
+        for path in map(os.path.normpath, inputs):
+            if path in raw or path.endswith(".py") or any(covers(output, path) for output in produced):
+                continue
+            later = [other.name for other in stages if any(covers(os.path.normpath(o), path) for o in other.outputs)]
+            problems.append(f"[{stage.name}] 輸入 {path} " +
+                            (f"由後面的階段 {', '.join(later)} 產生" if later else "沒有任何階段產生，也不是原始資料"))
+        produced.extend(os.path.normpath(output) for output in stage.outputs)
+    return problems
+
+
+def stage_files(stage):
+    if stage.suffix is not None:
+        return sorted(f for f in os.listdir(stage.per_file_folder) if f.endswith(stage.suffix))
+    return list_tables(stage.per_file_folder)
+
+
+def run_script(stage, env=None):
+    return subprocess.run([sys.executable, stage.script], env={**os.environ, **(stage.env or {}), **(env or {})}).returncode
+
+
+def run_stage(stage, state, force):
+    hash_cache = state.setdefault("hash_cache", {})
+    record = state.setdefault("stages", {}).setdefault(stage.name, {})
+
+    required = list(stage.inputs) + ([stage.per_file_folder] if stage.per_file_folder else [])
+    missing = [path for path in required if not os.path.exists(path)]
+    if missing:
+        print(f"⏭️ [{stage.name}] 缺少輸入，略過：{', '.join(missing)}")
+        return "skipped", 0
+
+    outputs_exist = all(os.path.exists(path) for path in stage.outputs)
+    shared = fingerprint([stage.script, *sorted(local_imports(stage.script)), *stage.inputs], hash_cache)
+
+    # 整個階段一起重跑
+    if stage.per_file_folder is None:
+        if not force and outputs_exist and record.get("inputs") == shared:
+            print(f"✔️ [{stage.name}] 輸入未變動，略過")
+            return "up-to-date", 0
+
+        print(f"▶️ [{stage.name}] 執行 {stage.script}")
+        if run_script(stage) != 0:
+            return "failed", "all"
+        record["inputs"] = shared
+        return "ran", "all"
+
+    # 依疾病檔案決定要重跑哪些
+    rerun_all = force or not outputs_exist or record.get("shared") != shared
+    previous = {} if rerun_all else record.get("files", {})
+    current = {
+        filename: file_hash(os.path.join(stage.per_file_folder, filename), hash_cache)
+        for filename in stage_files(stage)
+    }
+    changed = [filename for filename, digest in current.items() if previous.get(filename) != digest]
+
+    if not changed:
+        print(f"✔️ [{stage.name}] 輸入未變動，略過")
+        return "up-to-date", 0
+
+    print(f"▶️ [{stage.name}] 執行 {stage.script}（{len(changed)}/{len(current)} 個檔案）")
+    fd, report_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        returncode = run_script(stage, {
+            "PIPELINE_FILES": json.dumps(changed, ensure_ascii=False),
+            "PIPELINE_REPORT": report_path,
+        })
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f) if os.path.getsize(report_path) else {"succeeded": [], "failed": changed}
+    finally:
+        os.remove(report_path)
+
+    # 只記錄成功的檔案，失敗的下次會再重跑
+    files = {filename: digest for filename, digest in previous.items() if filename in current}
+    files.update({filename: current[filename] for filename in report["succeeded"]})
+    record["files"] = files
+    record["shared"] = shared
+
+    if returncode != 0 or report["failed"]:
+        return "failed", len(changed)
+    return "ran", len(changed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="依輸入雜湊增量執行整個分析流程")
+    parser.add_argument("stages", nargs="*", help="只執行指定階段（例如 8 9-2），預設全部")
+    parser.add_argument("--force", action="store_true", help="忽略雜湊紀錄，全部重跑")
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - {stage.name for stage in STAGES}
+    if unknown:
+        parser.error(f"未知的階段：{', '.join(sorted(unknown))}")
+
+    problems = check_dag(STAGES)
+    if problems:
+        print("❌ 階段設定有誤：\n" + "\n".join(problems))
+        sys.exit(2)
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state = {}
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH, encoding="utf-8") as f:
+            state = json.load(f)
+
+    timings = []
+    for stage in STAGES:
+        if args.stages and stage.name not in args.stages:
+            continue
+
+        start = time.perf_counter()
+        status, n_files = run_stage(stage, state, args.force)
+        seconds = time.perf_counter() - start
+        timings.append((stage.name, status, n_files, seconds))
+
+        # 每個階段結束就寫入狀態，中途中斷也不會遺失紀錄
+        with open(STATE_PATH, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+
+    # 記錄各階段耗時
+    new_log = not os.path.exists(TIMING_PATH)
+    with open(TIMING_PATH, "a", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        if new_log:
+            writer.writerow(["time", "stage", "status", "files", "seconds"])
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        for name, status, n_files, seconds in timings:
+            writer.writerow([now, name, status, n_files, f"{seconds:.2f}"])
+
+    print("\n階段      狀態         檔案數   秒數")
+    for name, status, n_files, seconds in timings:
+        print(f"{name:<9} {status:<12} {n_files:>5} {seconds:>8.2f}")
+
+    if any(status == "failed" for _, status, _, _ in timings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
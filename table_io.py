@@ -0,0 +1,136 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 階段之間中間檔的格式：csv（預設）、parquet、feather，可用環境變數 INTERMEDIATE_FORMAT 切換
+# 最終給人看的輸出（相關係數結果、分群結果、缺週清單等）一律維持 CSV
+INTERMEDIATE_FORMAT = os.environ.get("INTERMEDIATE_FORMAT", "csv")
+
+TABLE_EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+
+# 以 categorical 儲存的代碼/地名欄位（CSV 讀取時以字串讀入，保留開頭的 0）
+CATEGORICAL_COLS = ["ID1_CITY", "town", "region", "C_NAME"]
+
+# load_table 讀取時套用的精簡型別：年份／期數沒有缺值且是 int16 範圍內的整數時轉成 int16；比例與 PM2.5 可選 float32（compact_floats=True）
+INT16_COLS = ["year", "week", "month"]
+FLOAT32_COLS = ["case_per_capita(‰)", "PM2.5"]
+
+# load_table(cache=True) 保留的已解析表格數，最久未用的先移除
+# (路徑, 修改時間, 大小, 欄位, 年份範圍, 是否 float32) → DataFrame
+LOAD_CACHE_SIZE = 4
+_loaded = OrderedDict()
+
+
+def table_stem(filename):
+    stem, ext = os.path.splitext(filename)
+    return stem if ext in TABLE_EXTENSIONS.values() else filename
+
+
+# 列出資料夾中的表格檔（同名檔案有多種格式時，優先取目前設定的格式）
+def list_tables(folder):
+    preference = [INTERMEDIATE_FORMAT] + [fmt for fmt in TABLE_EXTENSIONS if fmt != INTERMEDIATE_FORMAT]
+    rank = {TABLE_EXTENSIONS[fmt]: i for i, fmt in enumerate(preference)}
+
+    chosen = {}
+    for filename in os.listdir(folder):
+        stem, ext = os.path.splitext(filename)
+        if ext in rank and (stem not in chosen or rank[ext] < rank[os.path.splitext(chosen[stem])[1]]):
+            chosen[stem] = filename
+    return sorted(chosen.values())
+
+
+# 依檔名主體找出已存在的表格檔路徑，找不到回傳 None
+def find_table(folder, stem):
+    for filename in list_tables(folder) if os.path.isdir(folder) else []:
+        if table_stem(filename) == stem:
+            return os.path.join(folder, filename)
+    return None
+
+
+def read_table(path, columns=None):
+    ext = os.path.splitext(path)[1]
+    if ext == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    if ext == ".feather":
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype={col: str for col in CATEGORICAL_COLS})
+
+
+# 有缺值、非整數或超出範圍的欄位維持原型別
+def _downcast_int16(df):
+    limits = np.iinfo(np.int16)
+    for col in INT16_COLS:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        values = df[col]
+        if len(values) and values.notna().all() and (values % 1 == 0).all() \
+                and limits.min <= values.min() and values.max() <= limits.max:
+            df[col] = values.astype("int16")
+    return df
+
+
+def _load(path, columns, years, compact_floats):
+    dtypes = {col: "category" for col in CATEGORICAL_COLS}
+    if compact_floats:
+        dtypes.update({col: "float32" for col in FLOAT32_COLS})
+
+    ext = os.path.splitext(path)[1]
+    if ext == ".parquet":
+        filters = [("year", ">=", years[0]), ("year", "<=", years[1])] if years else None
+        df = pd.read_parquet(path, columns=columns, filters=filters)
+    elif ext == ".feather":
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+
+    df = df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+    if years:
+        df = df[df["year"].between(*years)].reset_index(drop=True)
+    return _downcast_int16(df)
+
+
+# 共用載入器：讀取時就只取需要的欄位、套用精簡型別與年份範圍（parquet 直接下推篩選）
+# cache=True 用於同一行程內會重複讀取的檔案（例如逐疾病處理時每次都要的 PM2.5、人口檔）：
+# 沿用已解析的結果（檔案修改時間或大小改變則重讀），回傳副本供呼叫端修改；預設不快取、不複製
+def load_table(path, columns=None, years=None, compact_floats=False, cache=False):
+    columns = list(columns) if columns else None
+    if not cache:
+        return _load(path, columns, years, compact_floats)
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size,
+           tuple(columns) if columns else None, tuple(years) if years else None, compact_floats)
+    if key in _loaded:
+        _loaded.move_to_end(key)
+    else:
+        _loaded[key] = _load(path, columns, years, compact_floats)
+        if len(_loaded) > LOAD_CACHE_SIZE:
+            _loaded.popitem(last=False)
+    return _loaded[key].copy()
+
+
+# 依設定格式寫出中間檔，回傳輸出路徑
+def write_table(df, folder, stem, fmt=None):
+    fmt = fmt or INTERMEDIATE_FORMAT
+    path = os.path.join(folder, stem + TABLE_EXTENSIONS[fmt])
+
+    if fmt == "csv":
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+        return path
+
+    df = df.reset_index(drop=True)
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+    return path
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+# 鄉鎮維度表：每個 ID1_CITY 對應一個整數 town_key（依 ID1_CITY 排序編號）
+# 各來源的地名（ID_CNAME、PM2.5 檔、GML）先去除全形空白，再經別名表對應到 ID_CNAME 的名稱，合併一律用 town_key
+CODE_MAP_PATH = "ID_CNAME.csv"
+
+# 其他來源的寫法 → ID_CNAME 中的名稱（改制、異體字、截斷，以及健保資料只有一個代碼的市）
+NAME_ALIASES = {
+    '彰化縣員林市': '彰化縣員林鎮',
+    '苗栗縣頭份市': '苗栗縣頭份鎮',
+    '屏東縣三地門鄉': '屏東縣三地鄉',
+    '臺東縣太麻里鄉': '臺東縣太麻里',
+    '嘉義縣阿里山鄉': '嘉義縣阿里山',
+    '雲林縣莿桐鄉': '雲林縣荊桐鄉',
+    '嘉義市東區': '嘉義市',
+    '嘉義市西區': '嘉義市',
+    '新竹市東區': '新竹市',
+    '新竹市北區': '新竹市',
+    '新竹市香山區': '新竹市',
+}
+
+
+def clean_name(names):
+    return pd.Series(names, dtype=str).str.replace("　", "").str.strip()
+
+
+# 讀取維度表：town_key、ID1_CITY、C_NAME
+def load_town_dim(code_map_path=CODE_MAP_PATH):
+    code_map = pd.read_csv(code_map_path, dtype={'ID1_CITY': str})
+    dim = code_map.sort_values('ID1_CITY').reset_index(drop=True)
+    dim['C_NAME'] = clean_name(dim['C_NAME']).to_numpy()
+    dim.insert(0, 'town_key', np.arange(len(dim), dtype=np.int32))
+    return dim
+
+
+# ID1_CITY → town_key，對應不到為 -1
+def id_to_key(ids, dim):
+    lookup = pd.Series(dim['town_key'].to_numpy(), index=dim['ID1_CITY'])
+    return lookup.reindex(pd.Series(ids, dtype=str).to_numpy()).fillna(-1).to_numpy(dtype=np.int32)
+
+
+# 地名 → town_key（先去除空白並套用別名表），對應不到為 -1
+def name_to_key(names, dim):
+    lookup = pd.Series(dim['town_key'].to_numpy(), index=dim['C_NAME'])
+    cleaned = clean_name(names)
+    cleaned = cleaned.map(NAME_ALIASES).fillna(cleaned)
+    return lookup.reindex(cleaned.to_numpy()).fillna(-1).to_numpy(dtype=np.int32)
@@ -0,0 +1,123 @@
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import hashlib
+import os
+import island_filter
+import town_dim
+from island_filter import drop_outlying_islands
+from town_dim import load_town_dim, name_to_key
+
+# 鄉鎮地圖的共用底圖：本島邊界（GeoParquet 快取）與只繪製一次的多邊形，7.、9-6. 共用
+
+# 設定中文字體
+plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'SimHei', 'Microsoft YaHei', 'STHeiti']
+plt.rcParams['axes.unicode_minus'] = False
+
+# === 1. 邊界檔與快取設定 ===
+gml_path = "TOWN_MOI_1131028.gml"
+code_map_path = "ID_CNAME.csv"
+
+# 本島、已對應 ID1_CITY 的邊界以 GeoParquet 快取，檔名含 GML／對照表／篩選規則的雜湊，來源變動時自動重建
+MAP_CACHE_DIR = "map_cache"
+
+# 額外使用地名關鍵字過濾離島
+exclude_keywords = ['澎湖', '金門', '連江', '綠島', '蘭嶼', '琉球', '東沙', '南沙']
+
+
+def file_hash(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+# === 2. 建立本島邊界：GML 地名轉成 town_key，移除離島 ===
+def build_main_island(dim):
+    gdf = gpd.read_file(gml_path, encoding='utf-8')
+    gdf['town_key'] = name_to_key(gdf['名稱'], dim)
+    gdf['ID1_CITY'] = pd.Series(dim['ID1_CITY'].to_numpy()[gdf['town_key']], index=gdf.index).where(gdf['town_key'] >= 0)
+
+    # 移除離島地區（澎湖、金門、馬祖、綠島、蘭嶼）：依代碼與地名關鍵字向量化篩選
+    gdf = drop_outlying_islands(gdf)
+    gdf = gdf[~gdf['名稱'].str.contains('|'.join(exclude_keywords), na=False)]
+
+    return gdf[['名稱', 'town_key', 'ID1_CITY', 'geometry']].reset_index(drop=True)
+
+
+# === 3. 讀取快取，沒有或來源變動時重建 ===
+def load_main_island(dim):
+    key = hashlib.md5("|".join(
+        [file_hash(gml_path), file_hash(code_map_path), file_hash(island_filter.__file__),
+         file_hash(town_dim.__file__), *exclude_keywords]
+    ).encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(MAP_CACHE_DIR, f"main_island_{key}.parquet")
+
+    if os.path.exists(cache_path):
+        return gpd.read_parquet(cache_path)
+
+    gdf = build_main_island(dim)
+    os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+    for old_cache in os.listdir(MAP_CACHE_DIR):
+        if old_cache.startswith("main_island_"):
+            os.remove(os.path.join(MAP_CACHE_DIR, old_cache))
+    gdf.to_parquet(cache_path)
+    print(f"✅ 已建立本島邊界快取：{cache_path}")
+    return gdf
+
+
+# === 4. 讀取鄉鎮維度表與本島邊界 ===
+dim = load_town_dim(code_map_path)
+gdf = load_main_island(dim)
+
+# 輸出解析度與格式，可用環境變數 MAP_DPI、MAP_FORMAT（png、jpg、svg、pdf…）調整
+MAP_DPI = int(os.environ.get("MAP_DPI", 300))
+MAP_FORMAT = os.environ.get("MAP_FORMAT", "png")
+
+unmatched_color = '#D3D3D3'  # 淺灰（未對應地名）
+
+# 每個行程只建立一次的底圖（figure、多邊形集合、標題、各多邊形的 town_key）
+_canvas = None
+
+
+# === 5. 建立底圖：多邊形只繪製一次，之後每張地圖只更換填色 ===
+def get_canvas(legend_elements, legend_title):
+    global _canvas
+    if _canvas is not None:
+        return _canvas
+
+    # 拆成單一多邊形，每列對應集合中的一個 patch，填色才能依序對應
+    parts = gdf.explode(index_parts=False, ignore_index=True)
+    parts = parts[parts.geometry.notna() & ~parts.geometry.is_empty].reset_index(drop=True)
+
+    fig, ax = plt.subplots(figsize=(10, 12))
+    parts.plot(color=unmatched_color, linewidth=0.2, edgecolor='black', ax=ax, legend=False)
+    collection = ax.collections[0]
+    ax.legend(handles=legend_elements, title=legend_title, loc='lower left')
+
+    # 聚焦台灣本島
+    ax.set_xlim(119.3, 122.2)
+    ax.set_ylim(21.7, 25.4)
+    ax.axis('off')
+    title = ax.set_title("", fontsize=16)
+
+    _canvas = (fig, collection, title, parts['town_key'].to_numpy())
+    return _canvas
+
+
+# town_key → 色碼 的查表，最後一格給對應不到的 -1（淺灰）；重複代碼以最後一筆為準
+def color_lookup(keys, colors):
+    lookup = np.full(len(dim) + 1, unmatched_color, dtype=object)
+    matched = keys >= 0
+    lookup[keys[matched]] = np.asarray(colors, dtype=object)[matched]
+    return lookup
+
+
+# 依查表更換填色與標題後輸出，不重新繪製邊界
+def save_map(colors_by_key, title_text, out_path):
+    fig, collection, title, part_keys = _canvas
+    collection.set_facecolor(colors_by_key[part_keys].tolist())
+    title.set_text(title_text)
+    fig.savefig(out_path, dpi=MAP_DPI, bbox_inches='tight')
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from table_io import list_tables, read_table
+
+# 週資料密集張量快取：tensor_cache/{資料夾}_{欄位}/
+# values.npy：(疾病檔案 × 鄉鎮 × 年 × 53 週) 數值，缺值為 NaN；present.npy：是否有資料的遮罩
+# 以 mmap 讀取，各階段只取需要的切片；輸入檔案雜湊變動時自動重建
+TENSOR_CACHE_DIR = "tensor_cache"
+WEEKS = 53
+
+WeekTensor = namedtuple("WeekTensor", ["files", "towns", "years", "values", "present"])
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def _source_hashes(folder):
+    return {filename: file_hash(os.path.join(folder, filename)) for filename in list_tables(folder)}
+
+
+def build_tensor(folder, value_col, cache_dir):
+    filenames = list_tables(folder)
+    frames = [read_table(os.path.join(folder, filename), columns=['ID1_CITY', 'year', 'week', value_col])
+              for filename in filenames]
+
+    towns = np.unique(np.concatenate([df['ID1_CITY'].astype(str).to_numpy() for df in frames])).astype(str)
+    years = np.unique(np.concatenate([df['year'].to_numpy() for df in frames])).astype(int)
+
+    values = np.full((len(filenames), len(towns), len(years), WEEKS), np.nan)
+    for d, df in enumerate(frames):
+        town_idx = np.searchsorted(towns, df['ID1_CITY'].astype(str).to_numpy())
+        year_idx = np.searchsorted(years, df['year'].to_numpy())
+        values[d, town_idx, year_idx, df['week'].to_numpy() - 1] = df[value_col].to_numpy(dtype=float)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "values.npy"), values)
+    np.save(os.path.join(cache_dir, "present.npy"), ~np.isnan(values))
+    np.savez(os.path.join(cache_dir, "index.npz"),
+             files=np.array(filenames), towns=towns, years=years)
+
+
+# 讀取資料夾的週資料張量，沒有快取或輸入變動時先重建
+# 平行處理時請先在主行程呼叫一次，避免多個子行程同時重建
+def load_tensor(folder, value_col="case_c"):
+    cache_dir = os.path.join(TENSOR_CACHE_DIR, f"{os.path.basename(os.path.normpath(folder))}_{value_col}")
+    hash_path = os.path.join(cache_dir, "source_hash.json")
+
+    hashes = _source_hashes(folder)
+    cached = None
+    if os.path.exists(hash_path):
+        with open(hash_path, encoding="utf-8") as f:
+            cached = json.load(f)
+
+    if cached != hashes:
+        build_tensor(folder, value_col, cache_dir)
+        with open(hash_path, "w", encoding="utf-8") as f:
+            json.dump(hashes, f, ensure_ascii=False)
+        print(f"✅ 已建立週資料張量快取：{cache_dir}")
+
+    with np.load(os.path.join(cache_dir, "index.npz")) as index:
+        files, towns, years = index['files'], index['towns'], index['years']
+    return WeekTensor(
+        files=list(files),
+        towns=towns,
+        years=years,
+        values=np.load(os.path.join(cache_dir, "values.npy"), mmap_mode="r"),
+        present=np.load(os.path.join(cache_dir, "present.npy"), mmap_mode="r"),
+    )